@@ -0,0 +1,89 @@
+"""Two-level cache for AI article analysis: an in-process LRU in front of the
+`article_analyses` table. Entries are keyed by article id plus a hash of the
+title and body, so an edited article simply misses and gets regenerated."""
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from . import crud, ai_helper
+
+LRU_SIZE = int(os.getenv("AI_CACHE_SIZE", "256"))
+
+_lru = OrderedDict()
+_lock = Lock()
+
+
+def content_hash(title, body):
+    """Stable fingerprint of the article text the analysis was generated from."""
+    return hashlib.sha256(f"{title}\0{body}".encode("utf-8")).hexdigest()
+
+
+def _lru_get(key):
+    with _lock:
+        value = _lru.get(key)
+        if value is not None:
+            _lru.move_to_end(key)
+        return value
+
+
+def _lru_put(key, value):
+    with _lock:
+        _lru[key] = value
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+async def get_article_analysis(db, article, generate=True):
+    """Return {"summary", "vocabulary"} for an article, calling the LLM only on a miss."""
+    key = (article.id, content_hash(article.title, article.body))
+    cached = _lru_get(key)
+    if cached is not None:
+        return cached
+
+    row = await crud.get_article_analysis(db, article.id)
+    if row is not None and row.content_hash == key[1]:
+        result = {"summary": row.summary or "", "vocabulary": json.loads(row.vocabulary or "[]")}
+        _lru_put(key, result)
+        return result
+
+    if not generate:
+        return None
+
+    # The words to define were picked by text_analysis when the article was written.
+    words = json.loads(article.key_words) if article.key_words is not None else None
+    result = await ai_helper.generate_article_summary_async(article.title, article.body, words)
+    # Failed calls come back empty; don't pin them in the cache.
+    if result.get("summary") or result.get("vocabulary"):
+        await crud.save_article_analysis(db, article.id, key[1], result.get("summary", ""), result.get("vocabulary", []))
+        _lru_put(key, result)
+    return result
+
+
+async def warm_cache(db):
+    """Make sure every article has an up-to-date stored analysis."""
+    warmed = 0
+    for article in await crud.get_all_articles(db):
+        if await get_article_analysis(db, article, generate=False) is None:
+            await get_article_analysis(db, article)
+            warmed += 1
+    return warmed
+
+
+async def _warm():
+    from .database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        warmed = await warm_cache(db)
+    await ai_helper.close_async_client()
+    return warmed
+
+
+if __name__ == "__main__":
+    from .database import init_db
+
+    init_db()
+    print(f"Generated analysis for {asyncio.run(_warm())} article(s)")
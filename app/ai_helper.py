@@ -1,41 +1,169 @@
 import os
-import requests
+import asyncio
+import httpx
 import json
 from dotenv import load_dotenv
 
+from . import chunking, metrics, singleflight, resilience
+
 load_dotenv()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 MODEL = "google/gemini-2.5-flash-lite"
 
+# Seconds to wait for a completion, and how many may be in flight per process.
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "30"))
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "16"))
 
-def _call_openrouter(messages, temperature=0.7):
-    """Make a request to OpenRouter API using requests library."""
-    response = requests.post(
-        url=OPENROUTER_URL,
-        headers={
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": MODEL,
-            "messages": messages,
-            "temperature": temperature,
-        })
-    )
-    
+# Articles longer than SUMMARY_CHUNK_TOKENS are summarized in parts of that
+# size, at most SUMMARY_PARALLELISM parts at a time per article. Ask-AI prompts
+# include at most ASK_CONTEXT_TOKENS of the article, picked in ASK_CHUNK_TOKENS
+# passages.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_PARALLELISM = int(os.getenv("SUMMARY_PARALLELISM", "4"))
+ASK_CONTEXT_TOKENS = int(os.getenv("ASK_CONTEXT_TOKENS", "3000"))
+ASK_CHUNK_TOKENS = int(os.getenv("ASK_CHUNK_TOKENS", "300"))
+
+# Canned replies for failed Ask-AI calls; callers must not cache these.
+ASK_UNAVAILABLE = "Sorry, I couldn't generate an answer at this time."
+ASK_ERROR = "Sorry, an error occurred while processing your question."
+ASK_INTERRUPTED = "The answer was cut off. Please ask again."
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_async_client = None
+_async_limit = None
+
+
+def _get_async_client():
+    """Shared keep-alive client used by every awaitable call in this process."""
+    global _async_client, _async_limit
+    if _async_client is None:
+        # HTTP/2 multiplexes many requests over one connection, so the pool
+        # size alone doesn't bound in-flight calls; the semaphore does.
+        _async_limit = asyncio.Semaphore(OPENROUTER_MAX_CONCURRENCY)
+        _async_client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=OPENROUTER_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OPENROUTER_MAX_CONCURRENCY,
+                max_keepalive_connections=OPENROUTER_MAX_CONCURRENCY,
+                keepalive_expiry=60,
+            ),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def _payload(messages, temperature, stream=False):
+    payload = {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "usage": {"include": True},  # have OpenRouter report the cost with the token counts
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _message_content(result):
+    return result.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+
+async def _call_openrouter_async(messages, temperature=0.7, timeout=None):
+    """Make a request to OpenRouter API; identical concurrent calls share one request.
+
+    Raises resilience.Unavailable while OpenRouter is rate limited or failing.
+    """
+    key = singleflight.key_for(_payload(messages, temperature))
+    return await singleflight.run_async(
+        key, lambda: resilience.call_async(lambda: _post_openrouter_async(messages, temperature, timeout)))
+
+
+async def _post_openrouter_async(messages, temperature, timeout):
+    client = _get_async_client()
+    async with _async_limit:
+        with metrics.llm_attempt() as attempt:
+            response = await client.post(
+                OPENROUTER_URL,
+                headers=_headers(),
+                json=_payload(messages, temperature),
+                timeout=timeout or OPENROUTER_TIMEOUT,
+            )
+            attempt["status"] = response.status_code
+
+    resilience.check_status(response.status_code, response.headers)
     if response.status_code != 200:
         print(f"OpenRouter API Error: {response.status_code} - {response.text}")
         return None
-    
+
     result = response.json()
-    return result.get("choices", [{}])[0].get("message", {}).get("content", "")
+    metrics.record_usage(result.get("usage"))
+    return _message_content(result)
 
 
-def ask_about_article(article_title, article_body, question):
-    """Ask AI a question about an article."""
-    prompt = f"""You are an English learning assistant. A student is reading the following article and has a question.
+def _stream_openrouter_async(messages, temperature=0.7, timeout=None):
+    """Yield completion text as it arrives from OpenRouter's SSE stream."""
+    return resilience.stream_async(lambda: _stream_attempt(messages, temperature, timeout))
+
+
+async def _stream_attempt(messages, temperature, timeout):
+    client = _get_async_client()
+    async with _async_limit:
+        with metrics.llm_attempt() as attempt:
+            async with client.stream(
+                "POST",
+                OPENROUTER_URL,
+                headers=_headers(),
+                json=_payload(messages, temperature, stream=True),
+                timeout=timeout or OPENROUTER_TIMEOUT,
+            ) as response:
+                attempt["status"] = response.status_code
+                resilience.check_status(response.status_code, response.headers)
+                if response.status_code != 200:
+                    body = await response.aread()
+                    print(f"OpenRouter API Error: {response.status_code} - {body.decode(errors='replace')}")
+                    return
+                async for line in response.aiter_lines():
+                    # Lines starting with ':' are keep-alive comments.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    chunk = json.loads(data)
+                    # The last chunk carries the usage of the whole completion.
+                    metrics.record_usage(chunk.get("usage"))
+                    delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+                # Closed without [DONE]: what was sent is only part of the answer.
+                raise httpx.RemoteProtocolError("OpenRouter stream ended before [DONE]")
+
+
+def _ask_prompt(article_title, article_body, question):
+    # Long articles are cut down to the passages that best match the question.
+    article_body = chunking.relevant_text(article_body, question, ASK_CONTEXT_TOKENS, ASK_CHUNK_TOKENS)
+    return f"""You are an English learning assistant. A student is reading the following article and has a question.
 
 Article Title: {article_title}
 Article Content: {article_body}
@@ -44,26 +172,57 @@ Student's Question: {question}
 
 Provide a helpful, educational answer that helps them understand the article better. Keep it concise and clear.
 """
-    
+
+
+def _parse_answer(content):
+    if not content:
+        return ASK_UNAVAILABLE
+    return content
+
+
+async def ask_about_article_async(article_title, article_body, question):
+    """Ask AI a question about an article."""
     try:
-        content = _call_openrouter([
+        content = await _call_openrouter_async([
             {
                 "role": "user",
-                "content": prompt
+                "content": _ask_prompt(article_title, article_body, question)
             }
         ])
-        
-        if not content:
-            return "Sorry, I couldn't generate an answer at this time."
-        
-        return content
+        return _parse_answer(content)
     except Exception as e:
         print(f"AI Error: {e}")
-        return "Sorry, an error occurred while processing your question."
+        return ASK_ERROR
 
 
-def explain_test_answers(test_title, questions_and_answers):
-    """Generate explanations for test answers."""
+async def ask_about_article_stream(article_title, article_body, question):
+    """Streaming version of ask_about_article_async: yields pieces of the answer.
+
+    A failure before the first piece yields ASK_ERROR instead. A failure after
+    it is raised, so the caller knows the answer it has is incomplete; the
+    generator only ends normally once the whole answer has been yielded.
+    """
+    got_any = False
+    try:
+        async for piece in _stream_openrouter_async([
+            {
+                "role": "user",
+                "content": _ask_prompt(article_title, article_body, question)
+            }
+        ]):
+            got_any = True
+            yield piece
+    except Exception as e:
+        print(f"AI Error: {e}")
+        if got_any:
+            raise
+        yield ASK_ERROR
+        return
+    if not got_any:
+        yield _parse_answer("")
+
+
+def _explain_prompt(test_title, questions_and_answers):
     qa_text = "\n".join([
         f"Q{i+1}: {qa['question']}\n"
         f"Correct Answer: {qa['correct_answer']}\n"
@@ -71,8 +230,8 @@ def explain_test_answers(test_title, questions_and_answers):
         f"Result: {'✓ Correct' if qa['is_correct'] else '✗ Incorrect'}"
         for i, qa in enumerate(questions_and_answers)
     ])
-    
-    prompt = f"""You are an English teacher reviewing a student's test results. Provide brief, helpful explanations for each answer.
+
+    return f"""You are an English teacher reviewing a student's test results. Provide brief, helpful explanations for each answer.
 
 Test: {test_title}
 
@@ -90,35 +249,95 @@ Return ONLY a JSON array of explanations in this format:
   ...
 ]
 """
-    
+
+
+def _parse_explanations(content):
+    if not content:
+        return []
+
+    start = content.find('[')
+    end = content.rfind(']') + 1
+    if start != -1 and end > start:
+        content = content[start:end]
+
+    return json.loads(content)
+
+
+async def explain_test_answers_async(test_title, questions_and_answers):
+    """Generate explanations for test answers."""
+    try:
+        content = await _call_openrouter_async([
+            {
+                "role": "user",
+                "content": _explain_prompt(test_title, questions_and_answers)
+            }
+        ])
+        return _parse_explanations(content)
+    except Exception as e:
+        print(f"AI Error: {e}")
+        return []
+
+
+def _choices_prompt(test_title, questions):
+    qa_text = "\n".join([
+        f"Q{i+1}: {q['question']}\n" + "\n".join(
+            f"  {chr(65 + j)}) {choice}{' (correct)' if j == q['correct_index'] else ''}"
+            for j, choice in enumerate(q["choices"])
+        )
+        for i, q in enumerate(questions)
+    ])
+
+    return f"""You are an English teacher preparing feedback for a multiple-choice test. For every answer option, write what a student who picked that option should read.
+
+Test: {test_title}
+
+{qa_text}
+
+For each option, provide a concise explanation (1-2 sentences):
+- For the correct option: why it is right
+- For a wrong option: why it is wrong and what the correct answer is
+- Mention the key grammar/vocabulary point
+
+Return ONLY a JSON array of arrays, one inner array per question with one explanation per option, in order:
+[
+  ["Explanation for Q1 option A...", "Explanation for Q1 option B...", ...],
+  ...
+]
+"""
+
+
+async def explain_question_choices_async(test_title, questions):
+    """Generate an explanation for every option of every question in one call.
+
+    `questions` is a list of {"question", "choices", "correct_index"}; the
+    result is a list with one list of explanations per question, or [] on error.
+    """
     try:
-        content = _call_openrouter([
+        content = await _call_openrouter_async([
             {
                 "role": "user",
-                "content": prompt
+                "content": _choices_prompt(test_title, questions)
             }
         ])
-        
-        if not content:
-            return []
-        
-        start = content.find('[')
-        end = content.rfind(']') + 1
-        if start != -1 and end > start:
-            content = content[start:end]
-        
-        explanations = json.loads(content)
-        return explanations
+        return _parse_explanations(content)
     except Exception as e:
         print(f"AI Error: {e}")
         return []
 
 
-def generate_article_summary(article_title, article_body):
-    """Generate a summary and vocabulary list for an article."""
-    prompt = f"""Analyze this English article and provide:
+def _vocabulary_task(words, default):
+    """Second item of a summary prompt: let the model pick words, or define the given ones."""
+    if words is None:
+        return default
+    if words:
+        return "Short learner-friendly definitions of these words as used in the text: " + ", ".join(words)
+    return "An empty vocabulary list"
+
+
+def _summary_prompt(article_title, article_body, words=None):
+    return f"""Analyze this English article and provide:
 1. A brief summary (2-3 sentences)
-2. Key vocabulary words with definitions (5-7 words)
+2. {_vocabulary_task(words, "Key vocabulary words with definitions (5-7 words)")}
 
 Article Title: {article_title}
 Article Content: {article_body}
@@ -132,25 +351,124 @@ Return ONLY a JSON object with this format:
   ]
 }}
 """
-    
-    try:
-        content = _call_openrouter([
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ])
-        
-        if not content:
+
+
+def _chunk_summary_prompt(article_title, chunk, part, parts, words=None):
+    if words is not None:
+        words = [w for w in words if w in chunk.lower()]
+    return f"""This is part {part} of {parts} of an English article. Analyze this part and provide:
+1. A brief summary of this part (2-3 sentences)
+2. {_vocabulary_task(words, "Key vocabulary words from this part with definitions (3-5 words)")}
+
+Article Title: {article_title}
+Part {part} of {parts}: {chunk}
+
+Return ONLY a JSON object with this format:
+{{
+  "summary": "Summary text here...",
+  "vocabulary": [
+    {{"word": "word1", "definition": "definition here"}}
+  ]
+}}
+"""
+
+
+def _combine_prompt(article_title, partials, words=None):
+    parts = "\n\n".join(
+        f"Part summary: {p.get('summary', '')}\nVocabulary: "
+        + "; ".join(f"{v.get('word')}: {v.get('definition')}" for v in p.get("vocabulary", []) if isinstance(v, dict))
+        for p in partials
+    )
+    return f"""Below are summaries and vocabulary lists of consecutive parts of an English article, in order. Combine them into:
+1. A brief summary of the whole text (2-3 sentences)
+2. {_vocabulary_task(words, "The most useful vocabulary words with definitions (5-7 words), chosen from the lists")}
+
+Article Title: {article_title}
+
+{parts}
+
+Return ONLY a JSON object with this format:
+{{
+  "summary": "Summary text here...",
+  "vocabulary": [
+    {{"word": "word1", "definition": "definition here"}},
+    {{"word": "word2", "definition": "definition here"}}
+  ]
+}}
+"""
+
+
+def _reduce_groups(partials):
+    """Split partial results into groups whose combine prompt fits SUMMARY_CHUNK_TOKENS.
+
+    Every group has at least two members, so each round of combining shrinks
+    the list and a long article takes log(parts) rounds, each prompt bounded.
+    """
+    groups, size = [[]], 0
+    for p in partials:
+        tokens = chunking.estimate_tokens(json.dumps(p))
+        if len(groups[-1]) >= 2 and size + tokens > SUMMARY_CHUNK_TOKENS:
+            groups.append([])
+            size = 0
+        groups[-1].append(p)
+        size += tokens
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        groups[-2] += groups.pop()
+    return groups
+
+
+def _parse_summary(content):
+    if not content:
+        return {"summary": "", "vocabulary": []}
+
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start != -1 and end > start:
+        content = content[start:end]
+
+    return json.loads(content)
+
+
+async def _summarize_async(prompt, limit):
+    async with limit:
+        try:
+            return _parse_summary(await _call_openrouter_async([{"role": "user", "content": prompt}]))
+        except Exception as e:
+            print(f"AI Error: {e}")
             return {"summary": "", "vocabulary": []}
-        
-        start = content.find('{')
-        end = content.rfind('}') + 1
-        if start != -1 and end > start:
-            content = content[start:end]
-        
-        result = json.loads(content)
+
+
+def _all_summarized(partials):
+    return all(isinstance(p, dict) and p.get("summary") for p in partials)
+
+
+def _defined(result, words):
+    """`result` with one vocabulary entry per word in `words`, in that order."""
+    if words is None or not result.get("summary"):
         return result
-    except Exception as e:
-        print(f"AI Error: {e}")
-        return {"summary": "", "vocabulary": []}
\ No newline at end of file
+    definitions = {str(v.get("word", "")).lower(): v.get("definition", "")
+                   for v in result.get("vocabulary") or [] if isinstance(v, dict)}
+    return dict(result, vocabulary=[{"word": w, "definition": definitions.get(w, "")} for w in words])
+
+
+async def generate_article_summary_async(article_title, article_body, words=None):
+    """Generate a summary and vocabulary list for an article.
+
+    With `words` (text_analysis key words) the model only defines those
+    instead of choosing its own. Articles longer than SUMMARY_CHUNK_TOKENS are
+    summarized part by part, at most SUMMARY_PARALLELISM parts at a time, and
+    the partial results combined (see _reduce_groups). If any part fails the
+    result is empty, like a failed single call, rather than an analysis that
+    silently skips part of the article.
+    """
+    limit = asyncio.Semaphore(SUMMARY_PARALLELISM)
+    chunks = chunking.split(article_body, SUMMARY_CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return _defined(await _summarize_async(_summary_prompt(article_title, article_body, words), limit), words)
+    partials = await asyncio.gather(*(
+        _summarize_async(_chunk_summary_prompt(article_title, chunk, i + 1, len(chunks), words), limit)
+        for i, chunk in enumerate(chunks)))
+    while len(partials) > 1 and _all_summarized(partials):
+        partials = await asyncio.gather(*(
+            _summarize_async(_combine_prompt(article_title, group, words), limit) for group in _reduce_groups(partials)))
+    return _defined(partials[0], words) if _all_summarized(partials) else {"summary": "", "vocabulary": []}
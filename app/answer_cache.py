@@ -0,0 +1,178 @@
+"""Per-article cache of Ask-AI answers.
+
+Questions are normalized (case, punctuation, filler words) and looked up
+exactly first. A miss then falls back to a small character n-gram TF-IDF
+index over the content words (headwords and numbers, less _FUNCTION_WORDS)
+of the questions already answered for that article, and a near-duplicate is
+served instead of calling the LLM. It must have the same set of content words
+and score at least SIMILARITY_THRESHOLD, so word order still counts: n-grams
+of whole questions rate "paragraph 2" vs "paragraph 3" or "economy" vs
+"economics" above 0.8, and those questions need different answers. Entries expire after TTL seconds and the whole cache is an LRU
+capped at MAX_ENTRIES answers.
+"""
+import os
+import re
+import time
+import math
+from collections import OrderedDict, Counter
+from threading import Lock
+
+import numpy as np
+
+from .text_analysis import lemma
+
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Cosine similarity needed to reuse an answer; 0 turns the similarity index off.
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.85"))
+NGRAM = 3
+
+# Words that can differ between two phrasings of the same question. Unlike
+# chunking.STOPWORDS, this keeps question words, negation and "for"/"or".
+_FUNCTION_WORDS = frozenset("""
+a an the is are was were be been being do does did of in on to it its this that these those i me my you your
+can could would please tell explain about word phrase term mean means meaning s
+""".split())
+
+_FILLER = re.compile(r"^(?:(?:please|hey|hi|ai|can you|could you|would you|tell me|explain to me)\s+)+")
+
+# (article_id, normalized question) -> (answer, expires_at)
+_entries = OrderedDict()
+# article_id -> {"hash": content hash, "questions": {normalized: (content word ngram Counter, content word set)},
+#                 "index": cached matrix}
+_articles = {}
+_lock = Lock()
+_counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+
+def normalize(question):
+    q = question.lower()
+    q = re.sub(r"(?<!\w)'|'(?!\w)", " ", q)  # quotes, but not apostrophes in "what's"
+    q = re.sub(r"[^\w\s']", " ", q)
+    q = re.sub(r"\s+", " ", q).strip()
+    return _FILLER.sub("", q)
+
+
+def _ngrams(text):
+    padded = f" {text} "
+    return Counter(padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1))
+
+
+def content_words(text):
+    """The headwords and numbers of a normalized question that decide what it asks, in order."""
+    words = []
+    for w in text.split():
+        if w.endswith("n't") or w == "not":
+            words.append("not")
+        elif w not in _FUNCTION_WORDS and (head := lemma(w)) not in _FUNCTION_WORDS:
+            words.append(head)
+    return " ".join(words)
+
+
+def _article(article_id, article_hash):
+    """Per-article bookkeeping; dropped wholesale when the article text changes."""
+    entry = _articles.get(article_id)
+    if entry is None or entry["hash"] != article_hash:
+        if entry is not None:
+            for q in entry["questions"]:
+                _entries.pop((article_id, q), None)
+        entry = {"hash": article_hash, "questions": {}, "index": None}
+        _articles[article_id] = entry
+    return entry
+
+
+def _forget(article_id, q):
+    _entries.pop((article_id, q), None)
+    entry = _articles.get(article_id)
+    if entry is not None and entry["questions"].pop(q, None) is not None:
+        entry["index"] = None
+
+
+def _build_index(entry):
+    questions = list(entry["questions"])
+    vocab = {}
+    for q in questions:
+        for gram in entry["questions"][q][0]:
+            vocab.setdefault(gram, len(vocab))
+    tf = np.zeros((len(questions), len(vocab)), dtype=np.float32)
+    for row, q in enumerate(questions):
+        grams = entry["questions"][q][0]
+        tf[row, [vocab[g] for g in grams]] = list(grams.values())
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(questions)) / (1 + df)) + 1
+    entry["index"] = (questions, vocab, idf.astype(np.float32), tf)
+    return entry["index"]
+
+
+def _most_similar(entry, q):
+    """Closest cached question with the same content words and its cosine similarity, or (None, 0)."""
+    if not SIMILARITY_THRESHOLD:
+        return None, 0.0
+    words = frozenset(content_words(q).split())
+    if not any(cached_words == words for _, cached_words in entry["questions"].values()):
+        return None, 0.0
+    questions, vocab, idf, tf = entry["index"] or _build_index(entry)
+    query = np.zeros(len(vocab), dtype=np.float32)
+    unseen = 0.0
+    unseen_idf = math.log(1 + len(questions)) + 1
+    for gram, count in _ngrams(content_words(q)).items():
+        col = vocab.get(gram)
+        if col is not None:
+            query[col] = count
+        else:
+            # n-grams the index has never seen still count towards the query's length
+            unseen += (count * unseen_idf) ** 2
+    matrix = tf * idf
+    query *= idf
+    norms = np.linalg.norm(matrix, axis=1) * math.sqrt(float(query @ query) + unseen)
+    scores = (matrix @ query) / np.where(norms == 0, 1, norms)
+    scores[[entry["questions"][cached][1] != words for cached in questions]] = -1
+    best = int(np.argmax(scores))
+    return questions[best], float(scores[best])
+
+
+def lookup(article_id, article_hash, question):
+    """Return a cached answer for this question (or a near-duplicate), else None."""
+    q = normalize(question)
+    now = time.time()
+    with _lock:
+        entry = _article(article_id, article_hash)
+        candidates = [(q, "exact_hits")]
+        if q not in entry["questions"]:
+            similar, score = _most_similar(entry, q)
+            if similar is not None and score >= SIMILARITY_THRESHOLD:
+                candidates = [(similar, "similar_hits")]
+        for key, counter in candidates:
+            hit = _entries.get((article_id, key))
+            if hit is None:
+                continue
+            answer, expires_at = hit
+            if expires_at < now:
+                _forget(article_id, key)
+                continue
+            _entries.move_to_end((article_id, key))
+            _counters[counter] += 1
+            return answer
+        _counters["misses"] += 1
+        return None
+
+
+def store(article_id, article_hash, question, answer):
+    q = normalize(question)
+    with _lock:
+        entry = _article(article_id, article_hash)
+        _entries[(article_id, q)] = (answer, time.time() + TTL)
+        _entries.move_to_end((article_id, q))
+        words = content_words(q)
+        entry["questions"][q] = (_ngrams(words), frozenset(words.split()))
+        entry["index"] = None
+        while len(_entries) > MAX_ENTRIES:
+            (old_article, old_q), _ = _entries.popitem(last=False)
+            _forget(old_article, old_q)
+
+
+def stats():
+    with _lock:
+        total = sum(_counters.values())
+        hits = _counters["exact_hits"] + _counters["similar_hits"]
+        return dict(_counters, entries=len(_entries), hit_rate=hits / total if total else 0.0)
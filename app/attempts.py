@@ -0,0 +1,75 @@
+"""Batched writer for test attempts.
+
+submit_test grades an attempt and hands it to record(), which only queues it.
+One writer task per process collects queued attempts and writes up to
+BATCH_SIZE of them, together with their rollup updates, in a single
+transaction, waiting at most FLUSH_MS for a batch to fill. Heavy exam traffic
+therefore costs one commit per batch instead of one per submission, which
+matters on SQLite where every commit takes the database-wide write lock.
+Attempts still queued when a process is killed are lost; their scores were
+already shown to the user.
+"""
+import os
+import asyncio
+
+from . import crud
+from .database import AsyncSessionLocal
+
+BATCH_SIZE = int(os.getenv("ATTEMPT_BATCH_SIZE", "200"))
+FLUSH_MS = float(os.getenv("ATTEMPT_FLUSH_MS", "200"))
+
+_STOP = object()
+_queue = None
+_task = None
+
+
+async def _write(batch):
+    try:
+        async with AsyncSessionLocal() as db:
+            await crud.save_attempts(db, batch)
+    except Exception as e:
+        print(f"Failed to save {len(batch)} test attempt(s): {e}")
+
+
+async def _writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await _queue.get()
+        if item is _STOP:
+            return
+        batch = [item]
+        deadline = loop.time() + FLUSH_MS / 1000
+        while len(batch) < BATCH_SIZE:
+            try:
+                item = await asyncio.wait_for(_queue.get(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                await _write(batch)
+                return
+            batch.append(item)
+        await _write(batch)
+
+
+async def record(attempt):
+    """Queue a graded attempt (see crud.save_attempts for its shape)."""
+    if _queue is None:
+        await _write([attempt])  # writer not running, e.g. outside the app
+        return
+    _queue.put_nowait(attempt)
+
+
+async def start():
+    global _queue, _task
+    _queue = asyncio.Queue()
+    _task = asyncio.create_task(_writer())
+
+
+async def stop():
+    """Write whatever is still queued, then stop the writer."""
+    global _queue, _task
+    if _task is None:
+        return
+    _queue.put_nowait(_STOP)
+    await _task
+    _queue, _task = None, None
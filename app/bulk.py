@@ -0,0 +1,246 @@
+"""Bulk import and export of content as JSON Lines (one object per line).
+
+Every line has a "type" of "collection", "article" or "test"; the remaining
+fields are those of schemas.CollectionRecord, ArticleRecord and TestRecord:
+
+    {"type": "collection", "id": 3, "title": "Grammar", "description": ""}
+    {"type": "article", "title": "...", "body": "...", "author": "...", "collection_ids": [3]}
+    {"type": "test", "title": "...", "questions": [{"text": "...", "choices": ["a", "b"], "correct_index": 0}]}
+
+Imports read the input line by line and write BATCH_SIZE lines per
+transaction with multi-row INSERTs, so memory stays flat however large the
+file is. An article's collection_ids refer to collections earlier in the same
+file (by their "id") or to collections already in the database; unknown ids
+are ignored, as in the article form. If a line is invalid the import stops
+there; batches before it stay imported. Imported articles get their level,
+readability and key words (app.text_analysis) at import, and their AI
+analysis when first viewed (or from `python -m app.ai_cache`).
+
+Article rows (excerpt and text analysis, about 1 ms each) are prepared in a
+worker thread, so a batch doesn't hold up the event loop of a server that is
+importing over HTTP.
+
+Exports write the same format, collections first, reading from server-side
+cursors EXPORT_CHUNK rows at a time.
+
+    python -m app.bulk import content.jsonl
+    python -m app.bulk export content.jsonl    # "-" for stdin/stdout
+
+The HTTP endpoints (/bulk/import, /bulk/export) are off unless HTTP_TOKEN
+is set, and then need it as a bearer token.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime
+
+from sqlalchemy import select, insert, func, text
+
+from . import crud, models, schemas, text_analysis
+
+BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+HTTP_TOKEN = os.getenv("BULK_HTTP_TOKEN", "")
+
+RECORDS = {
+    "collection": schemas.CollectionRecord,
+    "article": schemas.ArticleRecord,
+    "test": schemas.TestRecord,
+}
+
+
+def _parse(line, lineno):
+    # JSONDecodeError and pydantic's ValidationError are both ValueErrors.
+    try:
+        data = json.loads(line)
+        kind = data.pop("type", None) if isinstance(data, dict) else None
+        if kind not in RECORDS:
+            raise ValueError(f"expected an object with a type of {', '.join(RECORDS)}")
+        return kind, RECORDS[kind](**data)
+    except ValueError as e:
+        raise ValueError(f"line {lineno}: {e}")
+
+
+async def _reserve_ids(db, table, n):
+    """`n` unused primary keys for `table`, so rows go in as plain executemany INSERTs
+    (an ordered INSERT ... RETURNING can't be batched on SQLite).
+
+    PostgreSQL takes them from the table's sequence. SQLite uses max(id): the
+    batch has already written by then, so this transaction holds the database
+    write lock and nobody else can insert until it commits.
+    """
+    if not n:
+        return []
+    if db.bind.dialect.name == "postgresql":
+        rows = await db.execute(text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :n)"),
+                                {"table": table.name, "n": n})
+        return [r[0] for r in rows]
+    start = await db.scalar(select(func.coalesce(func.max(table.c.id), 0)))
+    return list(range(start + 1, start + n + 1))
+
+
+async def _insert(db, table, rows):
+    if rows:
+        await db.execute(insert(table), rows)
+
+
+def _article_rows(arts, now):
+    """Article column values apart from the id."""
+    return [{"title": a.title, "body": a.body, "excerpt": crud.make_excerpt(a.body), "author": a.author or "Anonymous",
+             "created_at": a.created_at or now, **text_analysis.article_columns(a.body)} for a in arts]
+
+
+async def _write_batch(db, batch, collection_ids, counts):
+    """Insert one batch of parsed lines and commit. `collection_ids` maps file ids to new ones."""
+    now = datetime.utcnow()
+    by_kind = {kind: [r for k, r in batch if k == kind] for kind in RECORDS}
+    # CPU-bound, so off the event loop, and before the write lock is taken.
+    article_rows = await asyncio.to_thread(_article_rows, by_kind["article"], now)
+    # First write of the transaction; on SQLite it takes the write lock _reserve_ids relies on.
+    await crud.bump_cache_versions(db, "articles", "collections", "tests")
+
+    cols = by_kind["collection"]
+    ids = await _reserve_ids(db, models.Collection.__table__, len(cols))
+    await _insert(db, models.Collection.__table__, [
+        {"id": i, "title": c.title, "description": c.description or "", "created_at": c.created_at or now}
+        for c, i in zip(cols, ids)])
+    collection_ids.update((c.id, i) for c, i in zip(cols, ids) if c.id is not None)
+
+    arts = by_kind["article"]
+    wanted = {cid for a in arts for cid in a.collection_ids or () if cid not in collection_ids}
+    existing = set((await db.scalars(select(models.Collection.id).where(models.Collection.id.in_(wanted)))).all()) if wanted else set()
+    ids = await _reserve_ids(db, models.Article.__table__, len(arts))
+    await _insert(db, models.Article.__table__, [{"id": i, **row} for row, i in zip(article_rows, ids)])
+    links = set()
+    for a, article_id in zip(arts, ids):
+        for cid in a.collection_ids or ():
+            cid = collection_ids.get(cid, cid if cid in existing else None)
+            if cid is not None:
+                links.add((article_id, cid))
+    await _insert(db, models.article_collection, [{"article_id": a, "collection_id": c} for a, c in sorted(links)])
+
+    tests = by_kind["test"]
+    test_ids = await _reserve_ids(db, models.Test.__table__, len(tests))
+    await _insert(db, models.Test.__table__, [
+        {"id": i, "title": t.title, "description": t.description or "", "created_at": t.created_at or now}
+        for t, i in zip(tests, test_ids)])
+    questions = [(test_id, q) for t, test_id in zip(tests, test_ids) for q in t.questions]
+    question_ids = await _reserve_ids(db, models.Question.__table__, len(questions))
+    await _insert(db, models.Question.__table__, [
+        {"id": i, "test_id": test_id, "text": q.text, "correct_index": q.correct_index}
+        for (test_id, q), i in zip(questions, question_ids)])
+    await _insert(db, models.QuestionChoice.__table__, [
+        {"question_id": i, "position": pos, "text": c}
+        for (_, q), i in zip(questions, question_ids) for pos, c in enumerate(q.choices)])
+
+    await db.commit()
+    for kind, rows in by_kind.items():
+        counts[kind] += len(rows)
+
+
+async def import_lines(db, lines):
+    """Import JSON lines from an async iterable of str. Returns the number of rows per type."""
+    counts = dict.fromkeys(RECORDS, 0)
+    collection_ids = {}
+    batch = []
+    lineno = 0
+    async for line in lines:
+        lineno += 1
+        if not line.strip():
+            continue
+        batch.append(_parse(line, lineno))
+        if len(batch) >= BATCH_SIZE:
+            await _write_batch(db, batch, collection_ids, counts)
+            batch = []
+    if batch:
+        await _write_batch(db, batch, collection_ids, counts)
+    return counts
+
+
+async def stream_lines(chunks):
+    """Split an async iterable of bytes (e.g. a request body) into str lines."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if pending:
+        yield pending.decode("utf-8")
+
+
+async def _partitions(db, stmt):
+    result = await db.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+    async for rows in result.partitions():
+        yield rows
+
+
+def _line(kind, **fields):
+    if fields.get("created_at") is not None:
+        fields["created_at"] = fields["created_at"].isoformat()
+    return json.dumps(dict(type=kind, **fields), ensure_ascii=False) + "\n"
+
+
+async def export_lines(db):
+    """Yield every collection, article and test as JSON lines."""
+    c = models.Collection
+    async for rows in _partitions(db, select(c.id, c.title, c.description, c.created_at).order_by(c.id)):
+        for r in rows:
+            yield _line("collection", id=r.id, title=r.title, description=r.description, created_at=r.created_at)
+
+    a, link = models.Article, models.article_collection
+    async for rows in _partitions(db, select(a.id, a.title, a.body, a.author, a.created_at).order_by(a.id)):
+        members = {}
+        for article_id, collection_id in await db.execute(
+                select(link.c.article_id, link.c.collection_id).where(link.c.article_id.in_([r.id for r in rows]))):
+            members.setdefault(article_id, []).append(collection_id)
+        for r in rows:
+            yield _line("article", title=r.title, body=r.body, author=r.author,
+                        collection_ids=sorted(members.get(r.id, [])), created_at=r.created_at)
+
+    t, q, qc = models.Test, models.Question, models.QuestionChoice
+    async for rows in _partitions(db, select(t.id, t.title, t.description, t.created_at).order_by(t.id)):
+        ids = [r.id for r in rows]
+        questions = {}
+        for row in await db.execute(select(q.id, q.test_id, q.text, q.correct_index).where(q.test_id.in_(ids)).order_by(q.id)):
+            questions.setdefault(row.test_id, []).append({"id": row.id, "text": row.text, "choices": [], "correct_index": row.correct_index})
+        by_id = {item["id"]: item for items in questions.values() for item in items}
+        for question_id, text in await db.execute(
+                select(qc.question_id, qc.text).join(q, q.id == qc.question_id).where(q.test_id.in_(ids))
+                .order_by(qc.question_id, qc.position)):
+            by_id[question_id]["choices"].append(text)
+        for r in rows:
+            items = [{k: v for k, v in item.items() if k != "id"} for item in questions.get(r.id, [])]
+            yield _line("test", title=r.title, description=r.description, questions=items, created_at=r.created_at)
+
+
+async def _file_lines(f):
+    for line in f:
+        yield line
+
+
+async def _run(command, path):
+    from .database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        if command == "import":
+            with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+                return await import_lines(db, _file_lines(f))
+        with (sys.stdout if path == "-" else open(path, "w", encoding="utf-8")) as f:
+            async for line in export_lines(db):
+                f.write(line)
+
+
+if __name__ == "__main__":
+    from .database import init_db
+
+    parser = argparse.ArgumentParser(description="Import or export content as JSON Lines.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help='JSONL file, or "-" for stdin/stdout')
+    args = parser.parse_args()
+    init_db()
+    counts = asyncio.run(_run(args.command, args.path))
+    if counts is not None:
+        print(", ".join(f"{n} {kind}(s)" for kind, n in counts.items()), "imported", file=sys.stderr)
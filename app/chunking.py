@@ -0,0 +1,140 @@
+"""Token-bounded chunks of article text, and lexical retrieval over them.
+
+split() cuts a text on paragraph boundaries, then sentence boundaries, then
+spaces, into chunks of at most `max_tokens` (estimated at CHARS_PER_TOKEN
+characters per token, close enough for English prose). relevant_text() keeps
+only the chunks of a long text that best match a question, ranked with BM25,
+so an Ask-AI prompt stays the same size however long the article is. Chunk
+indexes are kept for the INDEX_CACHE_SIZE most recently asked-about texts.
+"""
+import os
+import re
+import math
+import hashlib
+from collections import Counter, OrderedDict
+from threading import Lock
+
+CHARS_PER_TOKEN = 4
+INDEX_CACHE_SIZE = int(os.getenv("CHUNK_INDEX_CACHE_SIZE", "64"))
+GAP = "\n\n[...]\n\n"  # marks text left out between two selected chunks
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does did for from has have how i if in is it its me my of on or
+so that the their them there these this those to was what when where which who why will with you your
+""".split())
+
+_indexes = OrderedDict()
+_lock = Lock()
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _pieces(text, max_chars):
+    """(piece, starts_paragraph) pairs, each piece at most max_chars long."""
+    for paragraph in _PARAGRAPH.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            yield paragraph, True
+            continue
+        first = True
+        for sentence in _SENTENCE.split(paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                yield sentence[:cut], first
+                sentence, first = sentence[cut:].lstrip(), False
+            if sentence:
+                yield sentence, first
+                first = False
+
+
+def split(text, max_tokens):
+    """Chunks of `text`, in order, each estimated at no more than `max_tokens`."""
+    max_chars = max(max_tokens * CHARS_PER_TOKEN, 1)
+    chunks, current = [], ""
+    for piece, new_paragraph in _pieces(text, max_chars):
+        sep = "\n\n" if new_paragraph else " "
+        if current and len(current) + len(sep) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = current + sep + piece if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _terms(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+class ChunkIndex:
+    """BM25 over the chunks of one text."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.counts = [Counter(_terms(c)) for c in chunks]
+        self.lengths = [sum(c.values()) for c in self.counts]
+        self.avg_length = sum(self.lengths) / len(chunks) if chunks else 1
+        df = Counter(term for counts in self.counts for term in counts)
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - d + 0.5) / (d + 0.5)) for term, d in df.items()}
+
+    def score(self, i, query_terms):
+        counts, norm = self.counts[i], self.K1 * (1 - self.B + self.B * self.lengths[i] / (self.avg_length or 1))
+        return sum(self.idf[t] * counts[t] * (self.K1 + 1) / (counts[t] + norm)
+                   for t in query_terms if t in counts)
+
+    def select(self, query, max_tokens):
+        """Indexes of the best-matching chunks that fit in `max_tokens`, in text order.
+
+        Chunks no query term matches rank by position, so a question with no
+        match gets the beginning of the text.
+        """
+        terms = set(_terms(query))
+        ranked = sorted(range(len(self.chunks)), key=lambda i: (-self.score(i, terms), i))
+        chosen, used = [], 0
+        for i in ranked:
+            tokens = estimate_tokens(self.chunks[i])
+            if used + tokens <= max_tokens:
+                chosen.append(i)
+                used += tokens
+        return sorted(chosen)
+
+
+def _index_for(text, chunk_tokens):
+    key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), chunk_tokens)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = ChunkIndex(split(text, chunk_tokens))
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def relevant_text(text, query, max_tokens, chunk_tokens):
+    """`text` itself if it fits in `max_tokens`, else its chunks most relevant to `query`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    index = _index_for(text, chunk_tokens)
+    chosen = index.select(query, max_tokens)
+    out = ""
+    for prev, i in zip([None] + chosen, chosen):
+        if prev is not None:
+            out += "\n\n" if i == prev + 1 else GAP
+        out += index.chunks[i]
+    return out
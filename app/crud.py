@@ -1,55 +1,453 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy import select, insert, and_, or_, update, tuple_, text, Integer, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload, undefer, defer
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from collections import Counter
+import base64
+import asyncio
+import json
+import re
+from . import models, schemas, text_analysis
 
-def get_articles(db: Session, skip: int=0, limit: int=100):
-    return db.query(models.Article).order_by(models.Article.created_at.desc()).offset(skip).limit(limit).all()
+# Loader options per page, so every view runs a fixed number of queries no
+# matter how many comments, questions or articles are attached.
+PROFILES = {
+    "article_card": (defer(models.Article.body),),
+    "article_detail": (selectinload(models.Article.comments),),
+    "collection_detail": (selectinload(models.Collection.articles).defer(models.Article.body),),
+    "collection_list": (undefer(models.Collection.article_count),),
+    "test_detail": (selectinload(models.Test.questions).selectinload(models.Question.choices),),
+    "test_list": (undefer(models.Test.question_count),),
+}
 
-def get_article(db: Session, article_id: int):
-    return db.query(models.Article).filter(models.Article.id==article_id).first()
+def _options(profile):
+    return PROFILES[profile] if profile else ()
 
-def create_article(db: Session, article_in: schemas.ArticleCreate):
-    article = models.Article(title=article_in.title, body=article_in.body, author=article_in.author)
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]  # older items
+    prev_cursor: Optional[str]  # newer items
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(f"{row.created_at.isoformat()}|{row.id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+
+async def _keyset_page(db: AsyncSession, stmt, model, limit: int, after: str = None, before: str = None):
+    """Newest-first page of `stmt` positioned by (created_at, id) instead of OFFSET,
+    so page N costs the same index seek as page 1."""
+    key = tuple_(model.created_at, model.id)
+    if before:
+        stmt = stmt.where(key > tuple_(*decode_cursor(before)))
+        rows = (await db.scalars(stmt.order_by(model.created_at.asc(), model.id.asc()).limit(limit + 1))).all()
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return Page(rows, encode_cursor(rows[-1]) if rows else None, encode_cursor(rows[0]) if has_newer else None)
+    if after:
+        stmt = stmt.where(key < tuple_(*decode_cursor(after)))
+    rows = (await db.scalars(stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1))).all()
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(rows[-1]) if has_older else None, encode_cursor(rows[0]) if after and rows else None)
+
+EXCERPT_LENGTH = 150
+
+def _plain_text(html: str):
+    return " ".join(re.sub(r"<[^>]+>", " ", html).split())
+
+def make_excerpt(body: str):
+    """Plain-text preview of an article body for listing cards."""
+    body = body or ""
+    # Try the start of the body first (minus a tag cut off at the end), so bulk
+    # imports don't run the regexes over every whole article.
+    text = _plain_text(re.sub(r"<[^>]*$", "", body[:EXCERPT_LENGTH * 8]))
+    if len(text) <= EXCERPT_LENGTH:
+        text = _plain_text(body)
+    if len(text) > EXCERPT_LENGTH:
+        return text[:EXCERPT_LENGTH].rstrip() + "..."
+    return text
+
+async def get_articles(db: AsyncSession, limit: int = 20, after: str = None, before: str = None, profile: str = "article_card", level: str = None):
+    stmt = select(models.Article).options(*_options(profile))
+    if level:
+        stmt = stmt.where(models.Article.level == level)
+    return await _keyset_page(db, stmt, models.Article, limit, after, before)
+
+def backfill_excerpts(db: Session, batch_size: int = 500):
+    """Fill `excerpt` for rows created before the column existed.
+
+    Sync, like the rest of database.init_db, which runs before the event loop.
+    """
+    filled = 0
+    while True:
+        rows = db.query(models.Article.id, models.Article.body).filter(models.Article.excerpt.is_(None)).limit(batch_size).all()
+        if not rows:
+            return filled
+        db.bulk_update_mappings(models.Article, [{"id": r.id, "excerpt": make_excerpt(r.body)} for r in rows])
+        db.commit()
+        filled += len(rows)
+
+def backfill_text_stats(db: Session, batch_size: int = 500):
+    """Fill the text_analysis columns for rows created before they existed or analyzed by an older version."""
+    filled = 0
+    outdated = or_(models.Article.analysis_version.is_(None), models.Article.analysis_version != text_analysis.VERSION)
+    while True:
+        rows = db.query(models.Article.id, models.Article.body).filter(outdated).limit(batch_size).all()
+        if not rows:
+            return filled
+        db.bulk_update_mappings(models.Article, [{"id": r.id, **text_analysis.article_columns(r.body)} for r in rows])
+        db.commit()
+        filled += len(rows)
+
+async def get_all_articles(db: AsyncSession):
+    return (await db.scalars(select(models.Article).order_by(models.Article.id))).all()
+
+# Highlight markers around matched terms in search snippets (private-use code
+# points, so they can't collide with article text and survive HTML escaping).
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+def _fts_query(words):
+    """Safe FTS5 query for a list of words: every word must match, the last as a prefix."""
+    terms = ['"{}"'.format(w) for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+# Weighted document vector for PostgreSQL search; database.init_db builds a
+# GIN index on exactly this expression.
+PG_SEARCH_VECTOR = ("setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                    "setweight(to_tsvector('english', coalesce(body, '')), 'B')")
+
+async def search_articles(db: AsyncSession, q: str, limit: int = 10, offset: int = 0):
+    """Best-matching articles first, with a highlighted snippet. Returns (rows, has_more).
+
+    SQLite uses the FTS5 table (bm25, title weighted over body); PostgreSQL
+    uses a weighted tsvector with ts_rank.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return [], False
+    if db.bind.dialect.name == "postgresql":
+        sql = (
+            "SELECT a.id, a.title, a.author, a.created_at, "
+            "ts_headline('english', a.body, query, :options) AS snippet "
+            f"FROM articles a, to_tsquery('english', :match) query WHERE ({PG_SEARCH_VECTOR}) @@ query "
+            f"ORDER BY ts_rank({PG_SEARCH_VECTOR}, query) DESC, a.id DESC LIMIT :limit OFFSET :offset"
+        )
+        params = {"match": " & ".join(words) + ":*",
+                  "options": f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=30, MinWords=12"}
+    else:
+        sql = (
+            "SELECT a.id, a.title, a.author, a.created_at, "
+            "snippet(articles_fts, 1, :start, :end, '...', 16) AS snippet "
+            "FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+            "WHERE articles_fts MATCH :match "
+            "ORDER BY bm25(articles_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        )
+        params = {"match": _fts_query(words), "start": MATCH_START, "end": MATCH_END}
+    rows = (await db.execute(
+        text(sql).columns(id=Integer, title=String, author=String, created_at=DateTime, snippet=String),
+        dict(params, limit=limit + 1, offset=offset),
+    )).all()
+    return rows[:limit], len(rows) > limit
+
+async def get_article(db: AsyncSession, article_id: int, profile: str = None):
+    return await db.scalar(select(models.Article).options(*_options(profile)).where(models.Article.id==article_id))
+
+def _derived_columns(body):
+    return {"excerpt": make_excerpt(body), **text_analysis.article_columns(body)}
+
+async def create_article(db: AsyncSession, article_in: schemas.ArticleCreate):
+    # Excerpt and text analysis take ~150 ms for a 1 MB body; keep them off the event loop.
+    derived = await asyncio.to_thread(_derived_columns, article_in.body)
+    article = models.Article(title=article_in.title, body=article_in.body, author=article_in.author, **derived)
     if article_in.collection_ids:
-        cols = db.query(models.Collection).filter(models.Collection.id.in_(article_in.collection_ids)).all()
+        cols = (await db.scalars(select(models.Collection).where(models.Collection.id.in_(article_in.collection_ids)))).all()
         article.collections = cols
     db.add(article)
-    db.commit()
-    db.refresh(article)
+    await bump_cache_versions(db, "articles")
+    await db.commit()
+    await db.refresh(article)
     return article
 
-def add_comment(db: Session, article_id: int, comment_in: schemas.CommentCreate):
+async def get_article_analysis(db: AsyncSession, article_id: int):
+    return await db.scalar(select(models.ArticleAnalysis).where(models.ArticleAnalysis.article_id==article_id))
+
+async def save_article_analysis(db: AsyncSession, article_id: int, content_hash: str, summary: str, vocabulary: list):
+    row = await get_article_analysis(db, article_id)
+    if row is None:
+        row = models.ArticleAnalysis(article_id=article_id)
+        db.add(row)
+    row.content_hash = content_hash
+    row.summary = summary
+    row.vocabulary = json.dumps(vocabulary)
+    await bump_cache_versions(db, f"article:{article_id}")
+    await db.commit()
+    return row
+
+async def add_comment(db: AsyncSession, article_id: int, comment_in: schemas.CommentCreate):
     comment = models.Comment(article_id=article_id, author=comment_in.author, text=comment_in.text)
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await bump_cache_versions(db, f"article:{article_id}")
+    await db.commit()
+    await db.refresh(comment)
     return comment
 
-def get_collections(db: Session):
-    return db.query(models.Collection).order_by(models.Collection.created_at.desc()).all()
+async def get_all_collections(db: AsyncSession):
+    return (await db.scalars(select(models.Collection).order_by(models.Collection.created_at.desc()))).all()
+
+async def get_collections(db: AsyncSession, limit: int = 20, after: str = None, before: str = None, profile: str = None):
+    return await _keyset_page(db, select(models.Collection).options(*_options(profile)), models.Collection, limit, after, before)
 
-def get_collection(db: Session, collection_id: int):
-    return db.query(models.Collection).filter(models.Collection.id==collection_id).first()
+async def get_collection(db: AsyncSession, collection_id: int, profile: str = None):
+    return await db.scalar(select(models.Collection).options(*_options(profile)).where(models.Collection.id==collection_id))
 
-def create_collection(db: Session, collection_in: schemas.CollectionCreate):
+async def create_collection(db: AsyncSession, collection_in: schemas.CollectionCreate):
     col = models.Collection(title=collection_in.title, description=collection_in.description)
     db.add(col)
-    db.commit()
-    db.refresh(col)
+    await bump_cache_versions(db, "collections")
+    await db.commit()
+    await db.refresh(col)
     return col
 
-def get_tests(db: Session):
-    return db.query(models.Test).order_by(models.Test.created_at.desc()).all()
+async def get_tests(db: AsyncSession, limit: int = 20, after: str = None, before: str = None, profile: str = None):
+    return await _keyset_page(db, select(models.Test).options(*_options(profile)), models.Test, limit, after, before)
 
-def get_test(db: Session, test_id: int):
-    return db.query(models.Test).filter(models.Test.id==test_id).first()
+async def get_test(db: AsyncSession, test_id: int, profile: str = None):
+    return await db.scalar(select(models.Test).options(*_options(profile)).where(models.Test.id==test_id))
 
-def create_test(db: Session, test_in: schemas.TestCreate):
+async def create_test(db: AsyncSession, test_in: schemas.TestCreate):
     t = models.Test(title=test_in.title, description=test_in.description)
     db.add(t)
-    db.flush()
+    await db.flush()
     for q in test_in.questions:
-        qdb = models.Question(test_id=t.id, text=q.text, choices="|".join(q.choices), correct_index=q.correct_index)
-        db.add(qdb)
-    db.commit()
-    db.refresh(t)
+        choices = [models.QuestionChoice(position=i, text=c) for i, c in enumerate(q.choices)]
+        db.add(models.Question(test_id=t.id, text=q.text, choices=choices, correct_index=q.correct_index))
+    await bump_cache_versions(db, "tests")
+    await db.commit()
+    await db.refresh(t)
     return t
+
+async def get_answer_key(db: AsyncSession, test_id: int):
+    """{question_id: correct_index} for every question of a test, in one query."""
+    rows = await db.execute(select(models.Question.id, models.Question.correct_index).where(models.Question.test_id==test_id))
+    return dict(rows.all())
+
+def migrate_question_choices(db: Session, batch_size: int = 500):
+    """Move "|"-joined choices of older questions into question_choices rows."""
+    moved = 0
+    while True:
+        rows = db.query(models.Question.id, models.Question.legacy_choices).filter(
+            models.Question.legacy_choices != "").limit(batch_size).all()
+        if not rows:
+            return moved
+        for question_id, legacy in rows:
+            db.query(models.QuestionChoice).filter(models.QuestionChoice.question_id==question_id).delete(synchronize_session=False)
+            db.add_all(models.QuestionChoice(question_id=question_id, position=i, text=c) for i, c in enumerate(legacy.split("|")))
+        db.query(models.Question).filter(models.Question.id.in_([r.id for r in rows])).update(
+            {"legacy_choices": ""}, synchronize_session=False)
+        db.commit()
+        moved += len(rows)
+
+async def save_attempts(db: AsyncSession, attempts: list):
+    """Write a batch of graded attempts and fold it into the stats rollups, in one transaction.
+
+    Each attempt is {"test_id", "correct", "total", "answers": [(question_id, choice_index, is_correct), ...]}.
+    """
+    rows = [models.TestAttempt(test_id=a["test_id"], correct=a["correct"], total=a["total"]) for a in attempts]
+    db.add_all(rows)
+    await db.flush()
+    answers = [{"attempt_id": row.id, "question_id": q, "choice_index": c, "is_correct": ok}
+               for row, a in zip(rows, attempts) for q, c, ok in a["answers"]]
+    if answers:
+        await db.execute(insert(models.AttemptAnswer), answers)
+
+    # Sum the batch first so each rollup row is updated once, in key order
+    # (concurrent writers on PostgreSQL then lock rows in the same order).
+    tests, questions, choices = {}, {}, Counter()
+    for a in attempts:
+        tests.setdefault(a["test_id"], Counter()).update(attempts=1, correct=a["correct"], total=a["total"])
+        for q, c, ok in a["answers"]:
+            questions.setdefault(q, Counter()).update(attempts=1, correct=int(bool(ok)))
+            choices[(q, c)] += 1
+    now = datetime.utcnow()
+    await db.execute(text(
+        "INSERT INTO test_stats (test_id, attempts, correct_sum, total_sum, updated_at) "
+        "VALUES (:test_id, :attempts, :correct, :total, :now) ON CONFLICT (test_id) DO UPDATE SET "
+        "attempts = test_stats.attempts + excluded.attempts, correct_sum = test_stats.correct_sum + excluded.correct_sum, "
+        "total_sum = test_stats.total_sum + excluded.total_sum, updated_at = excluded.updated_at"
+    ), [dict(counts, test_id=t, now=now) for t, counts in sorted(tests.items())])
+    if questions:
+        await db.execute(text(
+            "INSERT INTO question_stats (question_id, attempts, correct) VALUES (:question_id, :attempts, :correct) "
+            "ON CONFLICT (question_id) DO UPDATE SET attempts = question_stats.attempts + excluded.attempts, "
+            "correct = question_stats.correct + excluded.correct"
+        ), [dict(counts, question_id=q) for q, counts in sorted(questions.items())])
+        await db.execute(text(
+            "INSERT INTO choice_stats (question_id, choice_index, picks) VALUES (:question_id, :choice_index, :picks) "
+            "ON CONFLICT (question_id, choice_index) DO UPDATE SET picks = choice_stats.picks + excluded.picks"
+        ), [{"question_id": q, "choice_index": c, "picks": n} for (q, c), n in sorted(choices.items())])
+    await db.commit()
+
+async def get_test_stats(db: AsyncSession, test_id: int):
+    """Rollups for a test: (TestStats or None, {question_id: QuestionStats}, {question_id: {choice_index: picks}})."""
+    summary = await db.get(models.TestStats, test_id)
+    questions = (await db.scalars(select(models.QuestionStats).join(
+        models.Question, models.Question.id==models.QuestionStats.question_id).where(models.Question.test_id==test_id))).all()
+    picks = (await db.execute(select(models.ChoiceStats.question_id, models.ChoiceStats.choice_index, models.ChoiceStats.picks).join(
+        models.Question, models.Question.id==models.ChoiceStats.question_id).where(models.Question.test_id==test_id))).all()
+    distribution = {}
+    for question_id, choice_index, n in picks:
+        distribution.setdefault(question_id, {})[choice_index] = n
+    return summary, {r.question_id: r for r in questions}, distribution
+
+async def get_question_explanations(db: AsyncSession, keys):
+    """Stored explanations for (question_id, choice_index) pairs, as a dict keyed by pair."""
+    wanted = set(keys)
+    if not wanted:
+        return {}
+    rows = (await db.scalars(select(models.QuestionExplanation).where(
+        models.QuestionExplanation.question_id.in_({q for q, _ in wanted})))).all()
+    return {(r.question_id, r.choice_index): r.explanation for r in rows if (r.question_id, r.choice_index) in wanted}
+
+async def save_question_explanations(db: AsyncSession, explanations: dict):
+    for (question_id, choice_index), text in explanations.items():
+        await db.merge(models.QuestionExplanation(question_id=question_id, choice_index=choice_index, explanation=text))
+    await db.commit()
+
+async def enqueue_job(db: AsyncSession, kind: str, payload: dict, failed_cooldown: float = 0):
+    """Add a job unless an identical one is already waiting or running, or gave up
+    less than `failed_cooldown` seconds ago; that one is returned instead."""
+    data = json.dumps(payload, sort_keys=True)
+    blocking = models.Job.status.in_(("pending", "running"))
+    if failed_cooldown:
+        recently_failed = and_(models.Job.status=="failed",
+                               models.Job.updated_at > datetime.utcnow() - timedelta(seconds=failed_cooldown))
+        blocking = or_(blocking, recently_failed)
+    existing = await db.scalar(select(models.Job).where(
+        models.Job.kind==kind, models.Job.payload==data, blocking
+    ).limit(1))
+    if existing:
+        return existing
+    job = models.Job(kind=kind, payload=data, status="pending", attempts=0)
+    db.add(job)
+    await db.commit()
+    return job
+
+async def get_job(db: AsyncSession, job_id: int):
+    return await db.get(models.Job, job_id)
+
+async def get_unfinished_jobs(db: AsyncSession):
+    return (await db.scalars(select(models.Job).where(models.Job.status.in_(("pending", "running"))).order_by(models.Job.id))).all()
+
+async def _update_jobs(db: AsyncSession, where, values):
+    result = await db.execute(update(models.Job).where(*where).values(values).execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount
+
+async def reclaim_stale_jobs(db: AsyncSession, lease_seconds: float):
+    """Put jobs claimed more than `lease_seconds` ago, whose worker must have died, back
+    to pending; returns their ids. Jobs other live processes are running are left alone."""
+    stale = [models.Job.status=="running",
+             or_(models.Job.claimed_at.is_(None), models.Job.claimed_at < datetime.utcnow() - timedelta(seconds=lease_seconds))]
+    ids = (await db.scalars(select(models.Job.id).where(*stale))).all()
+    if ids:
+        await _update_jobs(db, [models.Job.id.in_(ids), *stale], {"status": "pending", "claimed_by": None, "claimed_at": None})
+    return ids
+
+async def claim_job(db: AsyncSession, job_id: int, owner: str):
+    """Atomically move a pending job to running; False if someone else got it."""
+    n = await _update_jobs(db, [models.Job.id==job_id, models.Job.status=="pending"],
+                           {"status": "running", "attempts": models.Job.attempts + 1,
+                            "claimed_by": owner, "claimed_at": datetime.utcnow()})
+    return n == 1
+
+async def release_job(db: AsyncSession, job_id: int):
+    """Hand back a job this process was interrupted in (e.g. at shutdown), without using up an attempt."""
+    await _update_jobs(db, [models.Job.id==job_id, models.Job.status=="running"],
+                       {"status": "pending", "attempts": models.Job.attempts - 1, "claimed_by": None, "claimed_at": None})
+
+async def finish_job(db: AsyncSession, job_id: int):
+    await _update_jobs(db, [models.Job.id==job_id], {"status": "done", "last_error": ""})
+
+async def fail_job(db: AsyncSession, job_id: int, error: str, retry_in=None):
+    """Record a failure; reschedule after `retry_in` seconds or give up when it is None."""
+    values = {"last_error": error}
+    if retry_in is None:
+        values["status"] = "failed"
+    else:
+        values["status"] = "pending"
+        values["run_after"] = datetime.utcnow() + timedelta(seconds=retry_in)
+    await _update_jobs(db, [models.Job.id==job_id], values)
+
+# The single-flight lease functions take a sync Session; singleflight calls them
+# through AsyncSession.run_sync.
+
+def acquire_flight(db: Session, key: str, owner: str, lease_seconds: float, result_seconds: float):
+    """Try to become the caller that runs the LLM request identified by `key`.
+
+    Returns ("leader", None), ("done", content) when a recent result exists,
+    or ("wait", None) while another owner holds a live lease.
+    """
+    now = datetime.utcnow()
+    row = db.query(models.LLMFlight).filter(models.LLMFlight.key==key).first()
+    if row is None:
+        db.add(models.LLMFlight(key=key, owner=owner, expires_at=now + timedelta(seconds=lease_seconds)))
+        try:
+            db.commit()
+            return "leader", None
+        except IntegrityError:
+            db.rollback()
+            return "wait", None
+    if row.finished_at is not None and row.finished_at > now - timedelta(seconds=result_seconds):
+        return "done", json.loads(row.result)["content"]
+    if row.finished_at is None and row.expires_at > now:
+        return "wait", None
+    # Expired lease or stale result: take it over, unless someone beat us to it.
+    n = db.query(models.LLMFlight).filter(
+        models.LLMFlight.key==key, models.LLMFlight.owner==row.owner, models.LLMFlight.expires_at==row.expires_at
+    ).update({
+        "owner": owner, "expires_at": now + timedelta(seconds=lease_seconds), "result": None, "finished_at": None,
+    }, synchronize_session=False)
+    db.commit()
+    return ("leader", None) if n == 1 else ("wait", None)
+
+def finish_flight(db: Session, key: str, owner: str, content, result_seconds: float):
+    now = datetime.utcnow()
+    db.query(models.LLMFlight).filter(models.LLMFlight.key==key, models.LLMFlight.owner==owner).update(
+        {"result": json.dumps({"content": content}), "finished_at": now}, synchronize_session=False)
+    db.query(models.LLMFlight).filter(models.LLMFlight.finished_at < now - timedelta(seconds=result_seconds)).delete(
+        synchronize_session=False)
+    db.commit()
+
+def release_flight(db: Session, key: str, owner: str):
+    """Drop an unfinished lease after a failed call, so the next caller becomes leader."""
+    db.query(models.LLMFlight).filter(
+        models.LLMFlight.key==key, models.LLMFlight.owner==owner, models.LLMFlight.finished_at.is_(None)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+async def row_exists(db: AsyncSession, model, row_id: int):
+    return await db.scalar(select(model.id).where(model.id==row_id)) is not None
+
+async def get_cache_versions(db: AsyncSession, names):
+    """{name: (version, updated_at)} for the given page-cache scopes; missing ones are absent."""
+    rows = (await db.scalars(select(models.CacheVersion).where(models.CacheVersion.name.in_(names)))).all()
+    return {r.name: (r.version, r.updated_at) for r in rows}
+
+async def bump_cache_versions(db: AsyncSession, *names):
+    """Invalidate cached pages for these scopes; takes effect when the caller commits."""
+    # Upsert, so two writers creating the same scope at once can't collide.
+    now = datetime.utcnow()
+    for name in names:
+        await db.execute(text(
+            "INSERT INTO cache_versions (name, version, updated_at) VALUES (:name, 1, :now) "
+            "ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1, updated_at = excluded.updated_at"
+        ), {"name": name, "now": now})
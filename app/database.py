@@ -0,0 +1,202 @@
+import os
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+def _normalize_url(url):
+    # Hosting platforms hand out postgres://, which SQLAlchemy 2 no longer accepts.
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+DB_URL = _normalize_url(os.getenv("DATABASE_URL", f"sqlite:///{str(BASE_DIR / 'database.db')}"))
+
+# Pool for server databases. Keep workers x (pool_size + max_overflow) below
+# the server's max_connections.
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),  # seconds; beats server/proxy idle timeouts
+    "pool_pre_ping": True,  # drop connections the server closed while idle
+}
+
+# Applied to every new SQLite connection. WAL lets readers run alongside a
+# writer; busy_timeout makes writers wait for the lock instead of failing.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": 1,  # NORMAL: durable across app crashes, fsync only at checkpoints
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),  # negative = KiB per connection
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "temp_store": 2,  # MEMORY
+}
+
+# Async driver to use for each backend's async engine.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def _set_sqlite_pragmas(dbapi_conn, record):
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def make_engine(url):
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_engine(url, future=True, **POOL_SETTINGS)
+    eng = create_engine(url, connect_args={"check_same_thread": False}, future=True)
+    event.listen(eng, "connect", _set_sqlite_pragmas)
+    return eng
+
+def make_async_engine(url):
+    """Async counterpart of make_engine (needs aiosqlite or asyncpg installed)."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    parsed = parsed.set(drivername=ASYNC_DRIVERS.get(backend, parsed.drivername))
+    if backend != "sqlite":
+        return create_async_engine(parsed, **POOL_SETTINGS)
+    # aiosqlite defaults to NullPool, which would reconnect and re-run the
+    # pragmas for every request.
+    eng = create_async_engine(parsed, poolclass=AsyncAdaptedQueuePool)
+    event.listen(eng.sync_engine, "connect", _set_sqlite_pragmas)
+    return eng
+
+def check_sqlite_pragmas():
+    """Fail at startup if SQLite silently ignored one of SQLITE_PRAGMAS."""
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return
+    wrong = {}
+    with engine.connect() as conn:
+        for name, expected in SQLITE_PRAGMAS.items():
+            actual = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            if str(actual).lower() != str(expected).lower():
+                wrong[name] = (expected, actual)
+    if wrong:
+        details = ", ".join(f"{n}: wanted {e}, got {a}" for n, (e, a) in wrong.items())
+        raise RuntimeError(f"SQLite pragmas not applied ({details})")
+
+engine = make_engine(DB_URL)
+# Objects stay loaded after commit so a template rendered after a write
+# doesn't reload everything it already has.
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+
+def _add_missing_columns(metadata):
+    """ALTER TABLE ... ADD COLUMN for model columns an older database lacks."""
+    existing = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not existing.has_table(table.name):
+                continue
+            present = {c["name"] for c in existing.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    ddl = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}')
+
+def init_db():
+    """Bring the schema up to date: missing tables, columns and indexes."""
+    from . import models, crud
+
+    models.Base.metadata.create_all(bind=engine)
+    _add_missing_columns(models.Base.metadata)
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    if engine.dialect.name == "sqlite":
+        check_sqlite_pragmas()
+        _create_search_index()
+    elif engine.dialect.name == "postgresql":
+        _create_pg_search_index()
+
+    db = SessionLocal()
+    try:
+        crud.backfill_excerpts(db)
+        crud.backfill_text_stats(db)
+        crud.migrate_question_choices(db)
+    finally:
+        db.close()
+
+def _create_search_index():
+    """FTS5 index over article title/body, kept in sync with `articles` by triggers."""
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'").first()
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+            "title, body, content='articles', content_rowid='id', tokenize='porter unicode61')"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN "
+            "INSERT INTO articles_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN "
+            "INSERT INTO articles_fts(articles_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE OF title, body ON articles BEGIN "
+            "INSERT INTO articles_fts(articles_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            "INSERT INTO articles_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        )
+        if not exists:
+            # Index the articles that predate the search table.
+            conn.exec_driver_sql("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+
+def _create_pg_search_index():
+    """GIN index over the same weighted tsvector expression crud.search_articles queries."""
+    from . import crud
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_articles_search ON articles USING GIN (({crud.PG_SEARCH_VECTOR}))"
+        )
+
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine(DB_URL)
+    return _async_engine
+
+def AsyncSessionLocal():
+    """New AsyncSession on the shared async engine, created on first use."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_sessionmaker = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker()
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement the engine executes inside the block.
+
+    Covers both the sync and the async engine. Used by bench/query_counts.py
+    to keep page query budgets from regressing.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [engine, get_async_engine().sync_engine]
+    for eng in engines:
+        event.listen(eng, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for eng in engines:
+            event.remove(eng, "before_cursor_execute", record)
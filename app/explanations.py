@@ -0,0 +1,82 @@
+"""Test-answer explanations assembled from per-(question, choice) pieces.
+
+An explanation depends only on the question and the choice that was picked,
+so each piece is stored once in `question_explanations` and reused for every
+later submission with the same pick. With PRECOMPUTE on, a background job
+writes the pieces for every option when the test is created, so grading
+never waits on the LLM; otherwise, or once that job has given up, missing
+pieces are requested at submit time. Either way a call covers at most
+BATCH_QUESTIONS questions, so a long test never needs one reply with hundreds
+of explanations, which is likely to come back truncated.
+"""
+import os
+import asyncio
+
+from . import crud, ai_helper
+
+NOT_ANSWERED = -1
+PRECOMPUTE = os.getenv("PRECOMPUTE_EXPLANATIONS", "1") == "1"
+BATCH_QUESTIONS = int(os.getenv("EXPLAIN_BATCH_QUESTIONS", "25"))
+
+
+def _batches(items):
+    return [items[i:i + BATCH_QUESTIONS] for i in range(0, len(items), BATCH_QUESTIONS)]
+
+
+async def explain_results(db, test, results, picks, fetch_missing=True, allow_fetch=None):
+    """Explanations aligned with `results`; `picks` holds (question_id, choice_index) per result.
+
+    Pieces that aren't stored come back as "" unless `fetch_missing` is set and
+    `allow_fetch`, called only when something is missing, doesn't return False.
+    """
+    known = await crud.get_question_explanations(db, picks)
+    missing = [i for i, key in enumerate(picks) if key not in known]
+    if missing and fetch_missing and (allow_fetch is None or allow_fetch()):
+        # Don't hold a pooled connection for the length of the LLM calls.
+        await db.close()
+        batches = _batches(missing)
+        replies = await asyncio.gather(*(
+            ai_helper.explain_test_answers_async(test.title, [results[i] for i in batch]) for batch in batches))
+        pieces = {}
+        for batch, fresh in zip(batches, replies):
+            # A reply of the wrong length can't be matched back to questions safely.
+            if len(fresh) == len(batch) and all(isinstance(text, str) for text in fresh):
+                pieces.update((picks[i], text) for i, text in zip(batch, fresh))
+        if pieces:
+            await crud.save_question_explanations(db, pieces)
+            known.update(pieces)
+    return [known.get(key, "") for key in picks]
+
+
+async def precompute(db, test):
+    """Store an explanation for every option of every question, BATCH_QUESTIONS questions per LLM call.
+
+    Each batch is saved as it arrives, so after a failure a retry only redoes
+    the questions still missing.
+    """
+    choices = {q.id: q.choice_texts for q in test.questions}
+    keys = [(q.id, j) for q in test.questions for j in range(len(choices[q.id]))]
+    known = await crud.get_question_explanations(db, keys)
+    todo = [q for q in test.questions if any((q.id, j) not in known for j in range(len(choices[q.id])))]
+
+    failed = 0
+    for batch in _batches(todo):
+        fresh = await ai_helper.explain_question_choices_async(test.title, [
+            {"question": q.text, "choices": choices[q.id], "correct_index": q.correct_index} for q in batch
+        ])
+        if len(fresh) != len(batch):
+            failed += len(batch)
+            continue
+        pieces = {}
+        for q, per_choice in zip(batch, fresh):
+            if not isinstance(per_choice, list) or len(per_choice) != len(choices[q.id]):
+                failed += 1
+                continue
+            for j, text in enumerate(per_choice):
+                pieces[(q.id, j)] = str(text)
+            if 0 <= q.correct_index < len(per_choice):
+                # Skipped questions get the explanation of the right answer.
+                pieces[(q.id, NOT_ANSWERED)] = str(per_choice[q.correct_index])
+        await crud.save_question_explanations(db, pieces)
+    if failed:
+        raise RuntimeError(f"no usable explanations for {failed} of {len(todo)} question(s)")
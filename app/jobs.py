@@ -0,0 +1,161 @@
+"""Background job queue backed by the `jobs` table.
+
+Jobs are written to the database first and then handed to an in-process
+asyncio queue, so anything still unfinished when the server stops is picked
+up again on the next startup. Every gunicorn worker runs its own job workers
+on the same table: claiming a job stamps it with the process and time, and a
+job left running longer than LEASE_SECONDS is taken to belong to a dead
+process and is put back in the queue, so a (re)starting worker never takes
+jobs its siblings are still running. A job interrupted by a graceful
+shutdown is handed back as pending straight away. A fixed number of worker tasks bounds how many
+jobs (and therefore LLM calls) run at once; failures are retried with
+exponential backoff until MAX_ATTEMPTS is reached. Jobs run on the event loop
+with their own AsyncSession, so they never hold a threadpool slot.
+"""
+import os
+import json
+import socket
+import asyncio
+from datetime import datetime
+
+from . import crud, ai_cache, explanations
+from .database import AsyncSessionLocal
+
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_SECONDS", "2"))
+# After a job has used up its attempts, identical ones aren't queued again for
+# this long, so views of an article whose analysis keeps failing don't keep
+# paying for new rounds of LLM calls.
+FAILED_COOLDOWN = float(os.getenv("JOB_FAILED_COOLDOWN_SECONDS", "3600"))
+# Longer than any job takes, OpenRouter timeouts and retries included.
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))
+
+_queue = None
+_loop = None
+_tasks = []
+
+
+async def _summarize_article(db, payload):
+    article = await crud.get_article(db, payload["article_id"])
+    if article is None:
+        return  # deleted before we got to it
+    result = await ai_cache.get_article_analysis(db, article)
+    if not (result.get("summary") or result.get("vocabulary")):
+        raise RuntimeError("empty analysis from LLM")
+
+
+async def _explain_test(db, payload):
+    test = await crud.get_test(db, payload["test_id"], profile="test_detail")
+    if test is None:
+        return
+    await explanations.precompute(db, test)
+
+
+HANDLERS = {
+    "summarize_article": _summarize_article,
+    "explain_test": _explain_test,
+}
+
+
+async def _run_job(job_id):
+    """Claim and execute one job. Returns a retry delay or None."""
+    async with AsyncSessionLocal() as db:
+        if not await crud.claim_job(db, job_id, _owner()):
+            return None
+        job = await crud.get_job(db, job_id)
+        kind, attempts = job.kind, job.attempts
+        try:
+            await HANDLERS[kind](db, json.loads(job.payload or "{}"))
+        except asyncio.CancelledError:
+            # Shut down mid-job. Left 'running', the next start would skip it
+            # until its lease ran out; hand it back instead.
+            await asyncio.shield(_release(job_id))
+            raise
+        except Exception as e:
+            await db.rollback()
+            print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {e}")
+            if attempts >= MAX_ATTEMPTS:
+                await crud.fail_job(db, job_id, str(e))
+                return None
+            delay = BACKOFF_BASE * 2 ** (attempts - 1)
+            await crud.fail_job(db, job_id, str(e), retry_in=delay)
+            return delay
+        await crud.finish_job(db, job_id)
+        return None
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"  # after fork, so per worker process
+
+
+async def _reclaimer():
+    """Requeue jobs whose process died mid-run, once their lease has run out."""
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 2)
+        try:
+            async with AsyncSessionLocal() as db:
+                for job_id in await crud.reclaim_stale_jobs(db, LEASE_SECONDS):
+                    _queue.put_nowait(job_id)
+        except Exception as e:
+            print(f"Job reclaim error: {e}")
+
+
+async def _release(job_id):
+    async with AsyncSessionLocal() as db:
+        await crud.release_job(db, job_id)
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            delay = await _run_job(job_id)
+            if delay is not None:
+                _loop.call_later(delay, _queue.put_nowait, job_id)
+        except Exception as e:
+            print(f"Job worker error: {e}")
+        finally:
+            _queue.task_done()
+
+
+def submit(job_id):
+    """Hand a stored job to the workers. Safe to call from any thread."""
+    if _loop is None:
+        return  # workers not running; the job is picked up on next startup
+    _loop.call_soon_threadsafe(_queue.put_nowait, job_id)
+
+
+async def enqueue(db, kind, payload):
+    job = await crud.enqueue_job(db, kind, payload, failed_cooldown=FAILED_COOLDOWN)
+    if job.status == "pending" and job.attempts == 0:
+        submit(job.id)
+    return job
+
+
+async def start():
+    global _queue, _loop
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue()
+    async with AsyncSessionLocal() as db:
+        await crud.reclaim_stale_jobs(db, LEASE_SECONDS)
+        now = datetime.utcnow()
+        for job in await crud.get_unfinished_jobs(db):
+            wait = (job.run_after - now).total_seconds() if job.run_after else 0
+            if wait > 0:
+                _loop.call_later(wait, _queue.put_nowait, job.id)
+            else:
+                _queue.put_nowait(job.id)
+    for _ in range(WORKERS):
+        _tasks.append(asyncio.create_task(_worker()))
+    if WORKERS:
+        _tasks.append(asyncio.create_task(_reclaimer()))
+
+
+async def stop():
+    global _loop
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _loop = None
@@ -1,122 +1,237 @@
 from fastapi import FastAPI, Request, Form, Depends, HTTPException
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse, PlainTextResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from pathlib import Path
+import os
+import hmac
 import json
+import math
+import re
+from markupsafe import Markup, escape
 
-from . import models, crud, schemas, ai_helper
+from . import crud, models, schemas, ai_helper, ai_cache, answer_cache, attempts, bulk, explanations, jobs, metrics, page_cache, profiler, resilience, text_analysis
+from .database import BASE_DIR, engine, get_async_engine, get_db, init_db
 
-BASE_DIR = Path(__file__).resolve().parent
-DB_URL = f"sqlite:///{str(BASE_DIR / 'database.db')}"
+init_db()
 
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False}, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-
-models.Base.metadata.create_all(bind=engine)
+# How many collections/tests the home page lists; the rest are a click away.
+INDEX_WIDGET_LIMIT = 6
 
 app = FastAPI()
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+
+def highlight(snippet):
+    """Escape a search snippet and turn crud's match markers into <mark> tags."""
+    plain = re.sub(r"<[^>]*>", " ", snippet or "")
+    html = str(escape(plain)).replace(crud.MATCH_START, "<mark>").replace(crud.MATCH_END, "</mark>")
+    return Markup(html)
+
+templates.env.filters["highlight"] = highlight
+
+# Results per search page.
+SEARCH_PAGE_SIZE = 10
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+metrics.instrument(app, templates, [engine, get_async_engine().sync_engine])
+profiler.instrument(app)
+
+@app.on_event("startup")
+async def start_jobs():
+    await jobs.start()
+    await attempts.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await attempts.stop()
+    await jobs.stop()
+    await ai_helper.close_async_client()
 
-def get_db():
-    db = SessionLocal()
+async def _page_or_400(getter, db, **kwargs):
     try:
-        yield db
-    finally:
-        db.close()
+        return await getter(db, **kwargs)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
 
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, db=Depends(get_db)):
-    articles = crud.get_articles(db, limit=10)
-    collections = crud.get_collections(db)
-    tests = crud.get_tests(db)
-    return templates.TemplateResponse("index.html", {"request": request, "articles": articles, "collections": collections, "tests": tests})
+async def index(request: Request, db=Depends(get_db)):
+    async def render():
+        articles = (await crud.get_articles(db, limit=10)).items
+        collections = (await crud.get_collections(db, limit=INDEX_WIDGET_LIMIT)).items
+        tests = (await crud.get_tests(db, limit=INDEX_WIDGET_LIMIT)).items
+        return templates.TemplateResponse("index.html", {"request": request, "articles": articles, "collections": collections, "tests": tests})
+    return await page_cache.cached_page(request, db, ["articles", "collections", "tests"], render)
 
 @app.get("/articles", response_class=HTMLResponse)
-def articles_list(request: Request, db=Depends(get_db)):
-    articles = crud.get_articles(db)
-    return templates.TemplateResponse("articles.html", {"request": request, "articles": articles})
+async def articles_list(request: Request, after: str = None, before: str = None, level: str = None, db=Depends(get_db)):
+    if level and level not in text_analysis.LEVELS:
+        raise HTTPException(status_code=400, detail="Unknown level")
+    async def render():
+        page = await _page_or_400(crud.get_articles, db, after=after, before=before, level=level)
+        return templates.TemplateResponse("articles.html", {"request": request, "articles": page.items, "page": page,
+                                                            "level": level, "levels": text_analysis.LEVELS})
+    return await page_cache.cached_page(request, db, ["articles"], render)
+
+@app.get("/search", response_class=HTMLResponse)
+async def search(request: Request, q: str = "", page: int = 1, db=Depends(get_db)):
+    page = max(page, 1)
+    results, has_more = await crud.search_articles(db, q, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    return templates.TemplateResponse("search.html", {
+        "request": request, "q": q, "results": results, "page": page, "has_more": has_more
+    })
 
 @app.get("/articles/create", response_class=HTMLResponse)
-def create_article_form(request: Request, db=Depends(get_db)):
-    collections = crud.get_collections(db)
+async def create_article_form(request: Request, db=Depends(get_db)):
+    collections = await crud.get_all_collections(db)
     return templates.TemplateResponse("create_article.html", {"request": request, "collections": collections})
 
 @app.post("/articles/create")
-def create_article(title: str = Form(...), body: str = Form(...), author: str = Form("Anonymous"), collection_ids: str = Form(""), db=Depends(get_db)):
+async def create_article(title: str = Form(...), body: str = Form(...), author: str = Form("Anonymous"), collection_ids: str = Form(""), db=Depends(get_db)):
     ids = [int(x) for x in collection_ids.split(",") if x.strip().isdigit()]
     article_in = schemas.ArticleCreate(title=title, body=body, author=author, collection_ids=ids)
-    article = crud.create_article(db, article_in)
+    article = await crud.create_article(db, article_in)
+    await jobs.enqueue(db, "summarize_article", {"article_id": article.id})
     return RedirectResponse(url=f"/articles/{article.id}", status_code=303)
 
 @app.get("/articles/{article_id}", response_class=HTMLResponse)
-def article_detail(request: Request, article_id: int, db=Depends(get_db)):
-    article = crud.get_article(db, article_id)
-    if not article:
-        raise HTTPException(status_code=404, detail="Article not found")
-    # Generate AI summary and vocabulary
-    ai_content = ai_helper.generate_article_summary(article.title, article.body)
-    return templates.TemplateResponse("article_detail.html", {
-        "request": request, 
-        "article": article, 
-        "ai_summary": ai_content.get("summary", ""),
-        "ai_vocabulary": ai_content.get("vocabulary", [])
-    })
+async def article_detail(request: Request, article_id: int, db=Depends(get_db)):
+    async def render():
+        article = await crud.get_article(db, article_id, profile="article_detail")
+        if not article:
+            raise HTTPException(status_code=404, detail="Article not found")
+        # AI summary and vocabulary are produced by a background job; never wait on the LLM here
+        ai_content = await ai_cache.get_article_analysis(db, article, generate=False)
+        if ai_content is None:
+            await jobs.enqueue(db, "summarize_article", {"article_id": article.id})
+            ai_content = {}
+        return templates.TemplateResponse("article_detail.html", {
+            "request": request, 
+            "article": article, 
+            "ai_summary": ai_content.get("summary", ""),
+            "ai_vocabulary": ai_content.get("vocabulary", []),
+            # Picked locally at write time, so they show while the definitions are still pending.
+            "key_words": json.loads(article.key_words or "[]"),
+            "ai_pending": not ai_content
+        })
+    # Pages still waiting for the AI analysis aren't cached, so the next view re-checks it.
+    return await page_cache.cached_page(request, db, [f"article:{article_id}"], render,
+                                  cache_if=lambda response: not response.context["ai_pending"],
+                                  exists=lambda: crud.row_exists(db, models.Article, article_id))
+
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on App
+# Platform). The client is the entry that many from the right; entries further
+# left are whatever the client sent and can't be trusted.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+def _client_ip(request):
+    if TRUSTED_PROXY_HOPS:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+def _check_ai_rate(request):
+    """Refuse with 429 once this client has used up its LLM request allowance."""
+    wait = resilience.allow_client(_client_ip(request))
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many AI requests, please slow down",
+                            headers={"Retry-After": str(math.ceil(wait))})
 
 @app.post("/articles/{article_id}/ask-ai")
-def ask_ai_about_article(article_id: int, question: str = Form(...), db=Depends(get_db)):
+async def ask_ai_about_article(request: Request, article_id: int, question: str = Form(...), db=Depends(get_db)):
     """Ask AI a question about an article."""
-    article = crud.get_article(db, article_id)
+    article = await crud.get_article(db, article_id)
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
+    # Hand the connection back to the pool before waiting on the LLM.
+    await db.close()
     
-    # Ask AI the question
-    answer = ai_helper.ask_about_article(article.title, article.body, question)
+    # Ask AI the question, unless it (or a near-duplicate) was already answered
+    article_hash = ai_cache.content_hash(article.title, article.body)
+    answer = answer_cache.lookup(article.id, article_hash, question)
+    if answer is None:
+        _check_ai_rate(request)
+        answer = await ai_helper.ask_about_article_async(article.title, article.body, question)
+        if answer not in (ai_helper.ASK_UNAVAILABLE, ai_helper.ASK_ERROR):
+            answer_cache.store(article.id, article_hash, question, answer)
     
     return {"answer": answer}
 
+@app.post("/articles/{article_id}/ask-ai/stream")
+async def ask_ai_about_article_stream(request: Request, article_id: int, question: str = Form(...), db=Depends(get_db)):
+    """Ask AI a question and stream the answer back as server-sent events."""
+    article = await crud.get_article(db, article_id)
+    if not article:
+        raise HTTPException(status_code=404, detail="Article not found")
+    article_id, title, body = article.id, article.title, article.body
+    await db.close()
+    article_hash = ai_cache.content_hash(title, body)
+    cached = answer_cache.lookup(article_id, article_hash, question)
+    if cached is None:
+        _check_ai_rate(request)
+
+    async def events():
+        if cached is not None:
+            yield f"data: {json.dumps(cached)}\n\n"
+        else:
+            # If the browser goes away Starlette cancels this generator, which
+            # closes the upstream stream and stops paying for tokens.
+            pieces = []
+            try:
+                async for piece in ai_helper.ask_about_article_stream(title, body, question):
+                    pieces.append(piece)
+                    yield f"data: {json.dumps(piece)}\n\n"
+            except Exception:
+                # Cut off mid-answer: tell the browser, and don't cache the fragment.
+                yield f"event: error\ndata: {json.dumps(ai_helper.ASK_INTERRUPTED)}\n\n"
+                return
+            answer = "".join(pieces)
+            if answer not in (ai_helper.ASK_UNAVAILABLE, ai_helper.ASK_ERROR):
+                answer_cache.store(article_id, article_hash, question, answer)
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/articles/{article_id}/comments")
-def add_comment(article_id: int, author: str = Form("Anonymous"), text: str = Form(...), db=Depends(get_db)):
+async def add_comment(article_id: int, author: str = Form("Anonymous"), text: str = Form(...), db=Depends(get_db)):
     comment_in = schemas.CommentCreate(author=author, text=text)
-    _ = crud.add_comment(db, article_id, comment_in)
+    _ = await crud.add_comment(db, article_id, comment_in)
     return RedirectResponse(url=f"/articles/{article_id}", status_code=303)
 
 @app.get("/collections", response_class=HTMLResponse)
-def collections_list(request: Request, db=Depends(get_db)):
-    collections = crud.get_collections(db)
-    return templates.TemplateResponse("collections.html", {"request": request, "collections": collections})
+async def collections_list(request: Request, after: str = None, before: str = None, db=Depends(get_db)):
+    page = await _page_or_400(crud.get_collections, db, after=after, before=before, profile="collection_list")
+    return templates.TemplateResponse("collections.html", {"request": request, "collections": page.items, "page": page})
 
 @app.get("/collections/create", response_class=HTMLResponse)
-def create_collection_form(request: Request):
+async def create_collection_form(request: Request):
     return templates.TemplateResponse("create_collection.html", {"request": request})
 
 @app.post("/collections/create")
-def create_collection(title: str = Form(...), description: str = Form(""), db=Depends(get_db)):
+async def create_collection(title: str = Form(...), description: str = Form(""), db=Depends(get_db)):
     col_in = schemas.CollectionCreate(title=title, description=description)
-    col = crud.create_collection(db, col_in)
+    col = await crud.create_collection(db, col_in)
     return RedirectResponse(url=f"/collections/{col.id}", status_code=303)
 
 @app.get("/collections/{collection_id}", response_class=HTMLResponse)
-def collection_detail(request: Request, collection_id: int, db=Depends(get_db)):
-    col = crud.get_collection(db, collection_id)
-    if not col:
-        raise HTTPException(status_code=404, detail="Collection not found")
-    return templates.TemplateResponse("collection_detail.html", {"request": request, "collection": col})
+async def collection_detail(request: Request, collection_id: int, db=Depends(get_db)):
+    async def render():
+        col = await crud.get_collection(db, collection_id, profile="collection_detail")
+        if not col:
+            raise HTTPException(status_code=404, detail="Collection not found")
+        return templates.TemplateResponse("collection_detail.html", {"request": request, "collection": col})
+    return await page_cache.cached_page(request, db, ["articles", "collections"], render,
+                                  exists=lambda: crud.row_exists(db, models.Collection, collection_id))
 
 @app.get("/tests", response_class=HTMLResponse)
-def tests_list(request: Request, db=Depends(get_db)):
-    tests = crud.get_tests(db)
-    return templates.TemplateResponse("tests.html", {"request": request, "tests": tests})
+async def tests_list(request: Request, after: str = None, before: str = None, db=Depends(get_db)):
+    page = await _page_or_400(crud.get_tests, db, after=after, before=before, profile="test_list")
+    return templates.TemplateResponse("tests.html", {"request": request, "tests": page.items, "page": page})
 
 @app.get("/tests/create", response_class=HTMLResponse)
-def create_test_form(request: Request):
+async def create_test_form(request: Request):
     return templates.TemplateResponse("create_test.html", {"request": request})
 
 @app.post("/tests/create")
-def create_test_simple(title: str = Form(...), description: str = Form(""), questions_json: str = Form(""), db=Depends(get_db)):
+async def create_test_simple(title: str = Form(...), description: str = Form(""), questions_json: str = Form(""), db=Depends(get_db)):
     try:
         questions = json.loads(questions_json or "[]")
     except Exception:
@@ -125,18 +240,32 @@ def create_test_simple(title: str = Form(...), description: str = Form(""), ques
     for q in questions:
         q_objs.append(schemas.QuestionCreate(text=q["text"], choices=q["choices"], correct_index=int(q["correct_index"])))
     test_in = schemas.TestCreate(title=title, description=description, questions=q_objs)
-    test = crud.create_test(db, test_in)
+    test = await crud.create_test(db, test_in)
+    if explanations.PRECOMPUTE:
+        await jobs.enqueue(db, "explain_test", {"test_id": test.id})
     return RedirectResponse(url=f"/tests/{test.id}", status_code=303)
 
 @app.get("/tests/{test_id}", response_class=HTMLResponse)
-def test_detail(request: Request, test_id: int, db=Depends(get_db)):
-    test = crud.get_test(db, test_id)
-    if not test:
-        raise HTTPException(status_code=404, detail="Test not found")
-    qlist = []
-    for q in test.questions:
-        qlist.append({"id": q.id, "text": q.text, "choices": q.choices.split("|")})
-    return templates.TemplateResponse("test_detail.html", {"request": request, "test": test, "questions": qlist})
+async def test_detail(request: Request, test_id: int, db=Depends(get_db)):
+    async def render():
+        test = await crud.get_test(db, test_id, profile="test_detail")
+        if not test:
+            raise HTTPException(status_code=404, detail="Test not found")
+        qlist = []
+        for q in test.questions:
+            qlist.append({"id": q.id, "text": q.text, "choices": q.choice_texts})
+        return templates.TemplateResponse("test_detail.html", {"request": request, "test": test, "questions": qlist})
+    return await page_cache.cached_page(request, db, ["tests"], render,
+                                  exists=lambda: crud.row_exists(db, models.Test, test_id))
+
+def _parse_answers(ans):
+    """{question_id: choice_index} from the submitted JSON object."""
+    if not isinstance(ans, dict):
+        raise HTTPException(status_code=400, detail="answers must be a JSON object")
+    try:
+        return {int(qid): int(sel) for qid, sel in ans.items() if sel is not None}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="answers must map question ids to choice indexes")
 
 @app.post("/tests/{test_id}/submit")
 async def submit_test(request: Request, test_id: int, answers: str = Form(...), db=Depends(get_db)):
@@ -144,30 +273,43 @@ async def submit_test(request: Request, test_id: int, answers: str = Form(...),
         ans = json.loads(answers)
     except Exception:
         raise HTTPException(status_code=400, detail="answers must be valid JSON")
-    test = crud.get_test(db, test_id)
+    test = await crud.get_test(db, test_id, profile="test_detail")
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
-    total = len(test.questions)
-    correct = 0
+    picked = _parse_answers(ans)
+    answer_key = await crud.get_answer_key(db, test_id)
+    total = len(answer_key)
+    correct = len(answer_key.items() & picked.items())
     results = []
+    picks = []
+    attempt_answers = []
     
     for q in test.questions:
-        sel = ans.get(str(q.id))
-        is_correct = False
-        if sel is not None and int(sel) == q.correct_index:
-            correct += 1
-            is_correct = True
-        
-        choices_list = q.choices.split("|")
+        choices_list = q.choice_texts
+        sel = picked.get(q.id)
+        answered = sel is not None and 0 <= sel < len(choices_list)
         results.append({
             "question": q.text,
             "correct_answer": choices_list[q.correct_index] if q.correct_index < len(choices_list) else "N/A",
-            "user_answer": choices_list[int(sel)] if sel is not None and int(sel) < len(choices_list) else "Not answered",
-            "is_correct": is_correct
+            "user_answer": choices_list[sel] if answered else "Not answered",
+            "is_correct": sel == q.correct_index
         })
+        picks.append((q.id, sel if answered else explanations.NOT_ANSWERED))
+        attempt_answers.append((q.id, picks[-1][1], sel == q.correct_index))
+    await attempts.record({"test_id": test.id, "correct": correct, "total": total, "answers": attempt_answers})
     
-    # Generate AI explanations
-    ai_explanations = ai_helper.explain_test_answers(test.title, results)
+    # AI explanations, reusing stored ones for picks seen before. When they are
+    # precomputed, a miss only schedules the background job, unless that job has
+    # given up; then, as without precomputation, the missing ones are fetched now.
+    # A client over its LLM allowance gets the score without new explanations;
+    # the allowance is only spent when something isn't stored.
+    allow_fetch = lambda: not resilience.allow_client(_client_ip(request))
+    ai_explanations = await explanations.explain_results(
+        db, test, results, picks, fetch_missing=not explanations.PRECOMPUTE, allow_fetch=allow_fetch)
+    if explanations.PRECOMPUTE and not all(ai_explanations):
+        job = await jobs.enqueue(db, "explain_test", {"test_id": test.id})
+        if job.status == "failed":
+            ai_explanations = await explanations.explain_results(db, test, results, picks, allow_fetch=allow_fetch)
     
     score = {"total": total, "correct": correct}
     return templates.TemplateResponse("test_result.html", {
@@ -177,3 +319,79 @@ async def submit_test(request: Request, test_id: int, answers: str = Form(...),
         "results": results,
         "ai_explanations": ai_explanations
     })
+
+@app.get("/tests/{test_id}/stats", response_class=HTMLResponse)
+async def test_stats(request: Request, test_id: int, db=Depends(get_db)):
+    test = await crud.get_test(db, test_id, profile="test_detail")
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    summary, per_question, distribution = await crud.get_test_stats(db, test_id)
+    qlist = []
+    for q in test.questions:
+        row = per_question.get(q.id)
+        seen = row.attempts if row else 0
+        picks = distribution.get(q.id, {})
+        qlist.append({
+            "text": q.text,
+            "attempts": seen,
+            "correct_rate": row.correct / seen if seen else None,
+            "choices": [{"text": text, "picks": picks.get(i, 0), "is_correct": i == q.correct_index}
+                        for i, text in enumerate(q.choice_texts)],
+            "skipped": picks.get(explanations.NOT_ANSWERED, 0),
+        })
+    return templates.TemplateResponse("test_stats.html", {
+        "request": request,
+        "test": test,
+        "attempts": summary.attempts if summary else 0,
+        "average_score": summary.correct_sum / summary.attempts if summary and summary.attempts else None,
+        "average_rate": summary.correct_sum / summary.total_sum if summary and summary.total_sum else None,
+        "questions": qlist,
+    })
+
+def _check_bearer(request, token, disabled):
+    """404 with `disabled` unless `token` is configured, then 401 unless the request bears it."""
+    if not token:
+        raise HTTPException(status_code=404, detail=disabled)
+    given = request.headers.get("authorization", "")
+    if not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+def _check_bulk_token(request: Request):
+    """Bulk endpoints exist only with BULK_HTTP_TOKEN set, and then need it as a bearer token."""
+    _check_bearer(request, bulk.HTTP_TOKEN, "Bulk import/export over HTTP is disabled")
+
+def _check_profile_token(request: Request):
+    """Profile endpoints exist only with profiling on and PROFILE_ADMIN_TOKEN set."""
+    _check_bearer(request, profiler.ADMIN_TOKEN if profiler.ENABLED else "", "Profiling is disabled")
+
+@app.post("/bulk/import", dependencies=[Depends(_check_bulk_token)])
+async def bulk_import(request: Request, db=Depends(get_db)):
+    """Import a JSON Lines request body (see app/bulk.py for the format)."""
+    try:
+        counts = await bulk.import_lines(db, bulk.stream_lines(request.stream()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"imported": counts}
+
+@app.get("/bulk/export", dependencies=[Depends(_check_bulk_token)])
+async def bulk_export(db=Depends(get_db)):
+    return StreamingResponse(bulk.export_lines(db), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics for this worker process."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles", dependencies=[Depends(_check_profile_token)])
+async def list_profiles():
+    """Stored request profiles, newest first (see app/profiler.py)."""
+    return {"profiles": [{k: v for k, v in p.items() if k != "file"} for p in profiler.list_profiles()]}
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(_check_profile_token)])
+async def download_profile(name: str):
+    path = profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=name + profiler.SUFFIX)
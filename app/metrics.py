@@ -0,0 +1,242 @@
+"""Prometheus metrics, served as text at /metrics.
+
+- http_request_duration_seconds: per route template, method and status.
+- db_queries_per_request / db_time_per_request_seconds: per route, from the
+  engines' cursor events; db_query_duration_seconds covers every statement,
+  including those of background jobs.
+- template_render_seconds: per template.
+- llm_request_duration_seconds (per HTTP status, or "error" when no response
+  came back), llm_tokens_total and llm_cost_total, from the `usage` field
+  OpenRouter returns with each completion.
+- The page cache, answer cache and resilience counters (see their stats()).
+
+Values are per process and nothing adds them up across processes. Under
+gunicorn with several workers each /metrics request reaches whichever worker
+accepts it, so successive scrapes mix different processes' totals and
+counters appear to reset; run with WEB_CONCURRENCY=1 when scraping. The
+stats() totals that only grow are exported as counters (STATS_COUNTERS), the
+rest as gauges. METRICS=0 turns the instrumentation and the endpoint off.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+ENABLED = os.getenv("METRICS", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# stats() keys, per module prefix, that only ever grow.
+STATS_COUNTERS = {
+    "page_cache": {"hits", "misses", "not_modified"},
+    "answer_cache": {"exact_hits", "similar_hits", "misses"},
+    "openrouter": {"calls", "succeeded", "failed", "retries", "client_limited", "global_limited",
+                   "short_circuited", "breaker_opened"},
+}
+
+_lock = threading.Lock()
+_request = ContextVar("metrics_request", default=None)  # [queries, query seconds] of the current request
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        with _lock:
+            s = self.series.get(label_values)
+            if s is None:
+                s = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            s[bisect_left(self.buckets, value)] += 1  # the +Inf slot is the one after the last bucket
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for values, s in sorted(series.items()):
+            labels = _labels(zip(self.labels, values))
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{_braced(labels)} {s[-2]}")
+            lines.append(f"{self.name}_count{_braced(labels)} {s[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.series = {}
+
+    def inc(self, amount, *label_values):
+        with _lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            series = dict(self.series)
+        for values, total in sorted(series.items()):
+            lines.append(f"{self.name}{_braced(_labels(zip(self.labels, values)))} {total}")
+        return lines
+
+
+def _labels(pairs):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _braced(labels):
+    return f"{{{labels}}}" if labels else ""
+
+
+http_duration = Histogram("http_request_duration_seconds", "Time to serve a request.",
+                          ("method", "route", "status"), LATENCY_BUCKETS)
+db_queries = Histogram("db_queries_per_request", "SQL statements run by one request.",
+                       ("route",), QUERY_COUNT_BUCKETS)
+db_request_time = Histogram("db_time_per_request_seconds", "Time one request spent in SQL statements.",
+                            ("route",), LATENCY_BUCKETS)
+db_query_duration = Histogram("db_query_duration_seconds", "Time per SQL statement.", (), LATENCY_BUCKETS)
+render_duration = Histogram("template_render_seconds", "Time to render a template.", ("template",), LATENCY_BUCKETS)
+llm_duration = Histogram("llm_request_duration_seconds", "Time per OpenRouter attempt.", ("status",), LLM_BUCKETS)
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by OpenRouter.", ("kind",))
+llm_cost = Counter("llm_cost_total", "Cost reported by OpenRouter, in credits.", ())
+
+METRICS = [http_duration, db_queries, db_request_time, db_query_duration, render_duration,
+           llm_duration, llm_tokens, llm_cost]
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request and the SQL it runs."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_and_watch(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request.set(db)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_watch)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request.reset(token)
+            # The router stores the matched route in the scope; use its template
+            # so /articles/1 and /articles/2 are one series.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_duration.observe(elapsed, scope["method"], route, status)
+            db_queries.observe(db[0], route)
+            db_request_time.observe(db[1], route)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    db_query_duration.observe(elapsed)
+    db = _request.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def _handle_error(context):
+    # after_cursor_execute doesn't fire for a failed statement.
+    if context.connection is not None and context.connection.info.get("metrics_started"):
+        context.connection.info["metrics_started"].pop()
+
+
+def _timed_template_response(template_response):
+    # Starlette renders the template inside TemplateResponse().
+    def TemplateResponse(name, context, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return template_response(name, context, *args, **kwargs)
+        finally:
+            render_duration.observe(time.perf_counter() - start, name)
+    return TemplateResponse
+
+
+def instrument(app, templates, engines):
+    """Hook the middleware, template timing and SQL events into the app."""
+    if not ENABLED:
+        return
+    app.add_middleware(MetricsMiddleware)
+    templates.TemplateResponse = _timed_template_response(templates.TemplateResponse)
+    for eng in engines:
+        event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+        event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+        event.listen(eng, "handle_error", _handle_error)
+
+
+@contextmanager
+def llm_attempt():
+    """Time one OpenRouter attempt. Set attempt["status"] once a response arrives."""
+    attempt = {"status": "error"}
+    start = time.perf_counter()
+    try:
+        yield attempt
+    finally:
+        llm_duration.observe(time.perf_counter() - start, attempt["status"])
+
+
+def record_usage(usage):
+    """Count the tokens and cost of one completion's `usage` object."""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            llm_tokens.inc(usage[kind], kind.split("_")[0])
+    if usage.get("cost"):
+        llm_cost.inc(usage["cost"])
+
+
+def _stats_lines(prefix, stats):
+    lines = []
+    counters = STATS_COUNTERS.get(prefix, ())
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, str):
+            lines += [f"# TYPE {name} gauge", f'{name}{{{key}="{_escape(value)}"}} 1']
+        elif key in counters:
+            lines += [f"# TYPE {name}_total counter", f"{name}_total {value}"]
+        else:
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    from . import answer_cache, page_cache, resilience
+
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _stats_lines("page_cache", page_cache.stats())
+    lines += _stats_lines("answer_cache", answer_cache.stats())
+    lines += _stats_lines("openrouter", resilience.stats())
+    return "\n".join(lines) + "\n"
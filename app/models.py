@@ -1,5 +1,5 @@
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Table, Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy.orm import declarative_base, relationship, column_property
+from sqlalchemy import Table, Column, Integer, String, Text, Boolean, Float, ForeignKey, DateTime, Index, select, func
 from datetime import datetime
 
 Base = declarative_base()
@@ -13,14 +13,36 @@ article_collection = Table(
 
 class Article(Base):
     __tablename__ = "articles"
+    # Keyset pagination walks (created_at, id) newest first, optionally within one level.
+    __table_args__ = (Index("ix_articles_created_at_id", "created_at", "id"),
+                      Index("ix_articles_level_created_at_id", "level", "created_at", "id"))
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     body = Column(Text, nullable=False)
+    excerpt = Column(Text, default="")  # plain-text start of body for listing cards
     author = Column(String(100), default="Anonymous")
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Filled from the body by text_analysis when the article is written.
+    word_count = Column(Integer)
+    reading_ease = Column(Float)  # Flesch reading ease
+    grade_level = Column(Float)  # Flesch-Kincaid grade
+    level = Column(String(2))  # CEFR-style A1..C2
+    key_words = Column(Text)  # JSON list of the words the AI analysis defines
+    analysis_version = Column(Integer)  # text_analysis.VERSION the columns above come from
 
     comments = relationship("Comment", back_populates="article", cascade="all, delete-orphan")
     collections = relationship("Collection", secondary=article_collection, back_populates="articles")
+    analysis = relationship("ArticleAnalysis", back_populates="article", uselist=False, cascade="all, delete-orphan")
+
+class ArticleAnalysis(Base):
+    __tablename__ = "article_analyses"
+    article_id = Column(Integer, ForeignKey("articles.id"), primary_key=True)
+    content_hash = Column(String(64), nullable=False)
+    summary = Column(Text, default="")
+    vocabulary = Column(Text, default="[]")  # JSON list of {"word", "definition"}
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    article = relationship("Article", back_populates="analysis")
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -34,6 +56,8 @@ class Comment(Base):
 
 class Collection(Base):
     __tablename__ = "collections"
+    # Keyset pagination walks (created_at, id) newest first.
+    __table_args__ = (Index("ix_collections_created_at_id", "created_at", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     description = Column(Text, default="")
@@ -43,6 +67,8 @@ class Collection(Base):
 
 class Test(Base):
     __tablename__ = "tests"
+    # Keyset pagination walks (created_at, id) newest first.
+    __table_args__ = (Index("ix_tests_created_at_id", "created_at", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     description = Column(Text, default="")
@@ -53,9 +79,113 @@ class Test(Base):
 class Question(Base):
     __tablename__ = "questions"
     id = Column(Integer, primary_key=True, index=True)
-    test_id = Column(Integer, ForeignKey("tests.id"))
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)
     text = Column(Text, nullable=False)
-    choices = Column(Text, nullable=False)
+    # Old "|"-joined storage. Moved into question_choices by crud.migrate_question_choices;
+    # still mapped so databases where it is NOT NULL accept new rows.
+    legacy_choices = Column("choices", Text, default="")
     correct_index = Column(Integer, nullable=False)
 
     test = relationship("Test", back_populates="questions")
+    choices = relationship("QuestionChoice", order_by="QuestionChoice.position", cascade="all, delete-orphan")
+    explanations = relationship("QuestionExplanation", cascade="all, delete-orphan")
+
+    @property
+    def choice_texts(self):
+        return [c.text for c in self.choices]
+
+class QuestionChoice(Base):
+    __tablename__ = "question_choices"
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # 0-based, what correct_index and answers refer to
+    text = Column(Text, nullable=False)
+
+class QuestionExplanation(Base):
+    """AI explanation for picking `choice_index` on a question (-1 = not answered)."""
+    __tablename__ = "question_explanations"
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    choice_index = Column(Integer, primary_key=True)
+    explanation = Column(Text, nullable=False)
+
+class TestAttempt(Base):
+    __tablename__ = "test_attempts"
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)
+    correct = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AttemptAnswer(Base):
+    """What an attempt picked for one question (-1 = not answered)."""
+    __tablename__ = "attempt_answers"
+    attempt_id = Column(Integer, ForeignKey("test_attempts.id"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    choice_index = Column(Integer, nullable=False)
+    is_correct = Column(Boolean, nullable=False)
+
+# Rollups kept up to date as attempts are written (see crud.save_attempts), so
+# the stats page never scans attempts.
+
+class TestStats(Base):
+    __tablename__ = "test_stats"
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct_sum = Column(Integer, nullable=False, default=0)
+    total_sum = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class QuestionStats(Base):
+    __tablename__ = "question_stats"
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+class ChoiceStats(Base):
+    """How often each option of a question was picked (-1 = not answered)."""
+    __tablename__ = "choice_stats"
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    choice_index = Column(Integer, primary_key=True)
+    picks = Column(Integer, nullable=False, default=0)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, default="{}")  # JSON
+    status = Column(String(20), default="pending", index=True)  # pending, running, done, failed
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String(64), nullable=True)  # host:pid of the worker running it
+    claimed_at = Column(DateTime, nullable=True)  # a running job older than the lease is reclaimed
+    last_error = Column(Text, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LLMFlight(Base):
+    """Lease on an in-progress LLM call, shared by every worker process."""
+    __tablename__ = "llm_flights"
+    key = Column(String(64), primary_key=True)
+    owner = Column(String(32), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    result = Column(Text, nullable=True)  # JSON {"content": ...} once finished
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+class CacheVersion(Base):
+    """Counter bumped whenever data behind a group of cached pages changes."""
+    __tablename__ = "cache_versions"
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Counts for listing pages, loaded only when a query asks for them (see crud.PROFILES).
+Collection.article_count = column_property(
+    select(func.count(article_collection.c.article_id))
+    .where(article_collection.c.collection_id == Collection.id)
+    .correlate_except(article_collection)
+    .scalar_subquery(),
+    deferred=True,
+)
+Test.question_count = column_property(
+    select(func.count(Question.id)).where(Question.test_id == Test.id).correlate_except(Question).scalar_subquery(),
+    deferred=True,
+)
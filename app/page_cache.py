@@ -0,0 +1,98 @@
+"""Rendered-page cache with conditional GET support.
+
+Each cached page depends on a few scopes ("articles", "tests", "article:7",
+...) whose version counters live in `cache_versions` and are bumped by the
+crud functions that change them. A request reads those counters (one small
+query), derives an ETag from route + query string + versions, and then:
+
+- answers 304 if the browser already has that ETag (or an If-Modified-Since
+  no older than the newest scope change) and, for a single object's page,
+  the object still exists; a missing one falls through to render()'s 404,
+- serves the stored HTML if this process rendered it before,
+- otherwise renders, stores and returns the page.
+
+Counters are in the database, so invalidation reaches every worker process.
+"""
+import os
+import hashlib
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+from threading import Lock
+
+from fastapi import Response
+from fastapi.responses import HTMLResponse
+
+from . import crud
+
+ENABLED = os.getenv("PAGE_CACHE", "1") == "1"
+MAX_PAGES = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+
+_pages = OrderedDict()  # etag -> rendered body
+_lock = Lock()
+_counters = {"hits": 0, "misses": 0, "not_modified": 0}
+
+
+def _not_modified(request, etag, last_modified):
+    match = request.headers.get("if-none-match")
+    if match is not None:
+        return etag in [tag.strip() for tag in match.split(",")] or match.strip() == "*"
+    since = request.headers.get("if-modified-since")
+    if since and last_modified is not None:
+        try:
+            return parsedate_to_datetime(since) >= last_modified.replace(microsecond=0)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def cached_page(request, db, scopes, render, cache_if=None, exists=None):
+    """Serve `await render()` (a TemplateResponse) through the cache.
+
+    `cache_if(response)` can veto storing a particular rendering, e.g. a page
+    that still shows a placeholder. For pages of one object, `await exists()`
+    is checked before answering 304, so "If-None-Match: *" or a guessed tag
+    can't turn a 404 into a 304.
+    """
+    if not ENABLED:
+        return await render()
+
+    versions = await crud.get_cache_versions(db, scopes)
+    stamp = "|".join(f"{name}={versions.get(name, (0, None))[0]}" for name in sorted(scopes))
+    key = f"{request.url.path}?{request.url.query}#{stamp}"
+    etag = '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+    changed = [v[1] for v in versions.values() if v[1] is not None]
+    last_modified = max(changed).replace(tzinfo=timezone.utc) if changed else None
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _not_modified(request, etag, last_modified) and (exists is None or await exists()):
+        _counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    with _lock:
+        body = _pages.get(etag)
+        if body is not None:
+            _pages.move_to_end(etag)
+    if body is not None:
+        _counters["hits"] += 1
+        return HTMLResponse(body, headers=headers)
+
+    _counters["misses"] += 1
+    response = await render()
+    if cache_if is not None and not cache_if(response):
+        return response
+    with _lock:
+        _pages[etag] = response.body
+        while len(_pages) > MAX_PAGES:
+            _pages.popitem(last=False)
+    response.headers.update(headers)
+    return response
+
+
+def stats():
+    total = sum(_counters.values())
+    served = _counters["hits"] + _counters["not_modified"]
+    return dict(_counters, pages=len(_pages), hit_rate=served / total if total else 0.0)
@@ -0,0 +1,209 @@
+"""Sampling profiler for individual requests, off unless configured.
+
+PROFILE_SAMPLE_RATE profiles that share of requests (0.01 = one in a
+hundred). PROFILE_SLOW_MS keeps the profile of any request that took at least
+that long; since slowness is only known at the end, every request is sampled
+while it is set. With neither set the middleware isn't installed at all.
+
+A background thread wakes every PROFILE_INTERVAL_MS and records one stack per
+profiled request. If the request's task is running, that is the event loop
+thread's Python stack from the task's coroutine down. If the task is suspended,
+it is the chain of awaiting coroutines ending in a "[waiting]" frame, so time
+spent waiting on the database or OpenRouter shows up as well (wall-clock
+profile). Profiles are written to PROFILE_DIR as speedscope JSON files
+(https://www.speedscope.app); the oldest are deleted once the directory
+exceeds PROFILE_MAX_MB. GET /admin/profiles lists them; since profiles show
+source paths, function names and per-route timings, those endpoints exist
+only with PROFILE_ADMIN_TOKEN set and need it as a bearer token.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime
+
+from .database import BASE_DIR
+
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(BASE_DIR.parent / "profiles"))
+MAX_BYTES = int(float(os.getenv("PROFILE_MAX_MB", "50")) * 1024 * 1024)
+ENABLED = SAMPLE_RATE > 0 or SLOW_MS > 0
+ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+SUFFIX = ".speedscope.json"
+WAITING = ("[waiting]", "", 0)
+
+_active = {}  # task -> Profile
+_lock = threading.Lock()
+_sampler = None
+_write_lock = threading.Lock()
+
+
+class Profile:
+    def __init__(self, task, loop, thread_id):
+        self.task, self.loop, self.thread_id = task, loop, thread_id
+        self.started = self.last = time.perf_counter()
+        self.stacks = []  # (tuple of frame keys, root first; milliseconds)
+
+    def sample(self, frames):
+        now = time.perf_counter()
+        stack = _running_stack(self, frames) if asyncio.current_task(self.loop) is self.task else None
+        if stack is None:
+            stack = _awaiting_stack(self.task)
+        if stack:
+            self.stacks.append((stack, (now - self.last) * 1000))
+        self.last = now
+
+
+def _key(frame):
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def _running_stack(profile, frames):
+    """The loop thread's stack from the task's outermost coroutine down, or None."""
+    frame = frames.get(profile.thread_id)
+    root = getattr(profile.task.get_coro(), "cr_frame", None)
+    stack = []
+    while frame is not None:
+        stack.append(_key(frame))
+        if frame is root:
+            return tuple(reversed(stack))
+        frame = frame.f_back
+    return None  # the task finished a step between the two checks
+
+
+def _awaiting_stack(task):
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+                 or getattr(awaitable, "gi_frame", None))
+        if frame is None:
+            break
+        stack.append(_key(frame))
+        awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+                     or getattr(awaitable, "gi_yieldfrom", None))
+    return tuple(stack) + (WAITING,) if stack else ()
+
+
+def _sample_forever():
+    while True:
+        time.sleep(INTERVAL_MS / 1000)
+        with _lock:
+            profiles = list(_active.values())
+        if profiles:
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+
+
+def _ensure_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_forever, name="request-profiler", daemon=True)
+            _sampler.start()
+
+
+def _speedscope(profile, name, elapsed_ms):
+    index, frames, samples, weights = {}, [], [], []
+    for stack, ms in profile.stacks:
+        for key in stack:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": key[0], "file": key[1], "line": key[2]})
+        samples.append([index[key] for key in stack])
+        weights.append(round(ms, 3))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "app.profiler",
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": name, "unit": "milliseconds",
+                      "startValue": 0, "endValue": round(elapsed_ms, 3), "samples": samples, "weights": weights}],
+    }
+
+
+def _save(profile, method, route, elapsed_ms):
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S.%f")
+    slug = "".join(c if c.isalnum() else "_" for c in route).strip("_") or "root"
+    name = f"{stamp}-{int(elapsed_ms)}ms-{method}-{slug}"
+    with _write_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, name + SUFFIX), "w") as f:
+            json.dump(_speedscope(profile, f"{method} {route} ({int(elapsed_ms)} ms)", elapsed_ms), f)
+        _rotate()
+
+
+def _rotate():
+    files = sorted(list_profiles(), key=lambda p: p["name"])
+    total = sum(p["bytes"] for p in files)
+    for p in files:
+        if total <= MAX_BYTES:
+            break
+        os.remove(os.path.join(PROFILE_DIR, p["file"]))
+        total -= p["bytes"]
+
+
+def list_profiles():
+    """Stored profiles, newest first."""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    out = []
+    for file in names:
+        name = file[:-len(SUFFIX)]
+        stamp, ms, method, route = (name.split("-", 3) + ["", "", ""])[:4]
+        try:
+            size = os.path.getsize(os.path.join(PROFILE_DIR, file))
+        except FileNotFoundError:  # rotated away meanwhile
+            continue
+        out.append({"name": name, "file": file, "method": method, "route": route,
+                    "duration_ms": int(ms[:-2]) if ms[:-2].isdigit() else None,
+                    "created": stamp, "bytes": size})
+    return sorted(out, key=lambda p: p["name"], reverse=True)
+
+
+def profile_path(name):
+    """Path of a stored profile, or None if there is no such profile."""
+    if name in {p["name"] for p in list_profiles()}:
+        return os.path.join(PROFILE_DIR, name + SUFFIX)
+    return None
+
+
+class ProfilerMiddleware:
+    """ASGI middleware that profiles sampled requests and stores the ones worth keeping."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        sampled = random.random() < SAMPLE_RATE
+        if scope["type"] != "http" or not (sampled or SLOW_MS):
+            return await self.app(scope, receive, send)
+        _ensure_sampler()
+        task = asyncio.current_task()
+        profile = Profile(task, asyncio.get_running_loop(), threading.get_ident())
+        with _lock:
+            _active[task] = profile
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            with _lock:
+                _active.pop(task, None)
+            elapsed_ms = (time.perf_counter() - profile.started) * 1000
+            if profile.stacks and (sampled or elapsed_ms >= SLOW_MS):
+                route = getattr(scope.get("route"), "path", scope["path"])
+                await asyncio.to_thread(_save, profile, scope["method"], route, elapsed_ms)
+
+
+def instrument(app):
+    if ENABLED:
+        app.add_middleware(ProfilerMiddleware)
@@ -0,0 +1,253 @@
+"""Overload protection around the OpenRouter integration.
+
+- Token buckets cap LLM-backed requests per client IP (checked by the
+  endpoints before they call the LLM) and upstream attempts per process.
+- A circuit breaker opens after BREAKER_FAILURES consecutive failed attempts.
+  While open, every call fails at once instead of waiting on a sick upstream,
+  so callers go straight to their usual fallback (an empty analysis, the
+  "couldn't answer" reply). After BREAKER_RESET_SECONDS one trial call is let
+  through; its outcome closes the breaker or opens it again.
+- Attempts that time out, can't connect, or get a 429/5xx are retried up to
+  RETRIES times with full-jitter exponential backoff.
+
+Limits and the breaker are per process. Setting a rate to 0 disables that limit.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict
+
+import httpx
+
+CLIENT_RATE = float(os.getenv("AI_CLIENT_RATE", "0.2"))  # LLM requests per second per client IP
+CLIENT_BURST = int(os.getenv("AI_CLIENT_BURST", "10"))
+GLOBAL_RATE = float(os.getenv("OPENROUTER_RATE", "20"))  # upstream attempts per second
+GLOBAL_BURST = int(os.getenv("OPENROUTER_BURST", "40"))
+BREAKER_FAILURES = int(os.getenv("OPENROUTER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("OPENROUTER_BREAKER_RESET_SECONDS", "30"))
+RETRIES = int(os.getenv("OPENROUTER_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_SECONDS", "0.5"))
+BACKOFF_MAX = 8.0
+MAX_CLIENTS = 10000  # client buckets kept; the least recently seen are dropped
+
+
+class Unavailable(Exception):
+    """The call was refused locally, without reaching OpenRouter."""
+
+
+class RateLimited(Unavailable):
+    pass
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class RetryableStatus(Exception):
+    """OpenRouter answered with a status worth retrying (429 or 5xx)."""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"OpenRouter returned {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+RETRYABLE = (RetryableStatus, httpx.TimeoutException, httpx.TransportError)
+
+
+def check_status(status_code, headers):
+    """Raise RetryableStatus for responses that should count as a failed attempt."""
+    if status_code == 429 or status_code >= 500:
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise RetryableStatus(status_code, retry_after)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Take one token; False if the bucket is empty."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        with self.lock:
+            return max(0.0, (1 - self.tokens) / self.rate) if self.rate else 0.0
+
+
+class CircuitBreaker:
+    def __init__(self, failures, reset_seconds):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failed = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state, self.failed, self.trial_running = "closed", 0, False
+
+    def release(self):
+        """End a half-open trial that says nothing about upstream health."""
+        with self.lock:
+            self.trial_running = False
+
+    def failure(self):
+        """Record a failed call; True if that opened the breaker."""
+        with self.lock:
+            self.failed += 1
+            trial, self.trial_running = self.trial_running, False
+            if self.state == "open" or not (trial or self.failed >= self.failures):
+                return False
+            self.state, self.opened_at = "open", time.monotonic()
+            return True
+
+
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+_global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+_client_buckets = OrderedDict()
+_lock = threading.Lock()
+_counters = {
+    "calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+    "client_limited": 0, "global_limited": 0, "short_circuited": 0, "breaker_opened": 0,
+}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def allow_client(client_ip):
+    """Take a token from this client's bucket. Returns 0 if allowed, else seconds to wait."""
+    if not CLIENT_RATE:
+        return 0
+    with _lock:
+        bucket = _client_buckets.get(client_ip)
+        if bucket is None:
+            bucket = _client_buckets[client_ip] = TokenBucket(CLIENT_RATE, CLIENT_BURST)
+            if len(_client_buckets) > MAX_CLIENTS:
+                _client_buckets.popitem(last=False)
+        _client_buckets.move_to_end(client_ip)
+    if bucket.take():
+        return 0
+    _count("client_limited")
+    return bucket.wait_time()
+
+
+def _before_attempt():
+    if not _breaker.allow():
+        _count("short_circuited")
+        raise CircuitOpen("OpenRouter circuit breaker is open")
+    if GLOBAL_RATE and not _global_bucket.take():
+        _count("global_limited")
+        _breaker.release()
+        raise RateLimited("OpenRouter call rate limit reached")
+
+
+def _backoff(attempt, error):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    retry_after = getattr(error, "retry_after", None)
+    return min(BACKOFF_MAX, max(delay, retry_after)) if retry_after else delay
+
+
+def _record_failure(error):
+    _count("failed")
+    if _breaker.failure():
+        _count("breaker_opened")
+        print(f"OpenRouter circuit breaker opened: {error!r}")
+
+
+def _after_failure(attempt, error):
+    """Record a failed attempt; returns the delay before retrying, or re-raises."""
+    _record_failure(error)
+    if attempt >= RETRIES or _breaker.state == "open":
+        raise error
+    _count("retries")
+    return _backoff(attempt, error)
+
+
+def _after_success():
+    _count("succeeded")
+    _breaker.success()
+
+
+async def call_async(attempt_fn):
+    """Run an OpenRouter attempt under the limits, the breaker and retries.
+
+    `attempt_fn` returns a coroutine; it is called once per attempt.
+    """
+    _count("calls")
+    for attempt in range(RETRIES + 1):
+        _before_attempt()
+        try:
+            result = await attempt_fn()
+        except RETRYABLE as e:
+            await asyncio.sleep(_after_failure(attempt, e))
+            continue
+        except BaseException:
+            _breaker.release()
+            raise
+        _after_success()
+        return result
+
+
+async def stream_async(stream_fn):
+    """call_async for streamed completions: `stream_fn()` returns an async iterator.
+
+    Attempts are only retried until the first piece has been passed on.
+    """
+    _count("calls")
+    for attempt in range(RETRIES + 1):
+        _before_attempt()
+        started = False
+        try:
+            async for piece in stream_fn():
+                started = True
+                yield piece
+        except RETRYABLE as e:
+            if started:
+                _record_failure(e)
+                raise
+            await asyncio.sleep(_after_failure(attempt, e))
+            continue
+        except BaseException:
+            _breaker.release()
+            raise
+        _after_success()
+        return
+
+
+def stats():
+    with _lock:
+        return dict(_counters, breaker_state=_breaker.state, clients_tracked=len(_client_buckets))
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 class CommentCreate(BaseModel):
     author: Optional[str] = "Anonymous"
@@ -24,3 +25,16 @@ class TestCreate(BaseModel):
     title: str
     description: Optional[str] = ""
     questions: List[QuestionCreate] = []
+
+# Rows of a bulk import file (see app/bulk.py). `id` is the id in the
+# exporting database and only used to resolve collection references.
+
+class CollectionRecord(CollectionCreate):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class ArticleRecord(ArticleCreate):
+    created_at: Optional[datetime] = None
+
+class TestRecord(TestCreate):
+    created_at: Optional[datetime] = None
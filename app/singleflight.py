@@ -0,0 +1,108 @@
+"""Collapse identical concurrent LLM calls into one upstream request.
+
+Within a process, callers with the same key wait on the first caller's
+future. Across uvicorn workers, the first
+caller takes a lease row in `llm_flights`; the others poll it until the result
+is published or the lease expires, in which case one of them takes over.
+A successful result stays readable for RESULT_SECONDS so that stragglers
+from the same burst get it too. A failure (an exception or no content) is
+never published: the leader drops its lease, and the next identical call
+contacts OpenRouter again.
+"""
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+
+from . import crud
+from .database import AsyncSessionLocal
+
+LEASE_SECONDS = float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "60"))
+RESULT_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_SECONDS", "30"))
+SHARED = os.getenv("SINGLEFLIGHT_SHARED", "1") == "1"
+POLL_INTERVAL = 0.1
+
+_OWNER_PREFIX = uuid.uuid4().hex[:24]
+
+_async_calls = {}  # key -> asyncio.Future
+
+
+def _owner():
+    # Includes the pid: workers forked from a preloaded master share module state.
+    return f"{_OWNER_PREFIX}{os.getpid():08x}"
+
+
+def key_for(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def _acquire_async(key):
+    if not SHARED:
+        return "leader", None
+    try:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(crud.acquire_flight, key, _owner(), LEASE_SECONDS, RESULT_SECONDS)
+    except Exception as e:
+        print(f"Single-flight lease error: {e}")
+        return "leader", None
+
+
+async def _publish_async(key, content):
+    if not SHARED:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(crud.finish_flight, key, _owner(), content, RESULT_SECONDS)
+    except Exception as e:
+        print(f"Single-flight publish error: {e}")
+
+
+async def _release_async(key):
+    if not SHARED:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(crud.release_flight, key, _owner())
+    except Exception as e:
+        print(f"Single-flight release error: {e}")
+
+
+async def _run_shared_async(key, fn):
+    while True:
+        state, content = await _acquire_async(key)
+        if state == "done":
+            return content
+        if state == "leader":
+            try:
+                content = await fn()
+            except BaseException:
+                await _release_async(key)
+                raise
+            if content:
+                await _publish_async(key, content)
+            else:
+                await _release_async(key)
+            return content
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def run_async(key, fn):
+    """Await `fn()` once per key; concurrent callers share its result.
+
+    Followers of a leader that raised get None, the same as a failed call.
+    """
+    future = _async_calls.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    future = asyncio.get_running_loop().create_future()
+    _async_calls[key] = future
+    try:
+        result = await _run_shared_async(key, fn)
+        future.set_result(result)
+        return result
+    except BaseException:
+        future.set_result(None)
+        raise
+    finally:
+        _async_calls.pop(key, None)
@@ -0,0 +1,248 @@
+"""Vocabulary and readability statistics for article text, computed locally.
+
+analyze() tokenizes an article body and, without calling the LLM, works out:
+
+- how hard its vocabulary is: each word is reduced to a headword and ranked by
+  its position in data/word_frequency.txt. The CEFR-style level is the
+  smallest band of most frequent words (LEVEL_BANDS) that covers 95% of the
+  text, the usual lexical-coverage threshold for reading without a
+  dictionary; texts that need more than the whole list are C1 or C2 by the
+  share of unlisted words. Long sentences raise the level one step.
+  Everyday words beginners learn first but general text rarely uses (cat,
+  apple) are listed by level in data/basic_words.txt and rank no lower than
+  the top of that level's band. Texts shorter than MIN_LEVEL_WORDS get no
+  level: a handful of words can't say which share of a text is unknown.
+- Flesch reading ease and Flesch-Kincaid grade, from words per sentence and
+  estimated syllables per word.
+- the KEY_WORDS words a learner most likely doesn't know yet: not among the
+  KEY_WORD_MIN_RANK most frequent, weighted by rarity and by how often the
+  article uses them. The LLM is then only asked to define these.
+
+Results are stored on the article row when it is written, so listings can
+filter by level and the article page shows them before any AI analysis exists.
+"""
+import os
+import re
+import json
+import math
+import html
+import heapq
+from collections import Counter
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from .chunking import STOPWORDS
+
+# Bump when the rules or word lists change, so stored results are recomputed.
+VERSION = 2
+FREQUENCY_LIST = os.path.join(os.path.dirname(__file__), "data", "word_frequency.txt")
+BASIC_WORDS = os.path.join(os.path.dirname(__file__), "data", "basic_words.txt")
+KEY_WORDS = int(os.getenv("KEY_WORDS", "7"))
+KEY_WORD_MIN_RANK = int(os.getenv("KEY_WORD_MIN_RANK", "1500"))
+
+LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+# Highest frequency rank a level's vocabulary reaches; B2 is the rest of the list.
+LEVEL_BANDS = ((800, "A1"), (1500, "A2"), (2500, "B1"))
+COVERAGE = 0.95
+C1_MAX_UNLISTED = 0.10  # share of words not in the list above which a text is C2
+MIN_LEVEL_WORDS = int(os.getenv("MIN_LEVEL_WORDS", "50"))  # non-name words needed to pick a level
+LONG_SENTENCE_WORDS = 25
+
+_TAG = re.compile(r"<[^>]+>")
+_WORD = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)*")
+_SENTENCE_END = re.compile(r"[.!?]+(?=\s|$)|</(?:p|h[1-6]|li|blockquote)>|<br\s*/?>", re.I)
+_VOWELS = re.compile(r"[aeiouy]+")
+# Whitespace before a word character: no token, sentence end or <br /> spans it.
+_CUT = re.compile(r"\s(?=\w)")
+_CHUNK = 65536
+
+CONTRACTIONS = {"can't": "can", "won't": "will", "shan't": "shall", "ain't": "be"}
+IRREGULAR = {
+    "am": "be", "is": "be", "are": "be", "was": "be", "were": "be", "been": "be", "being": "be",
+    "has": "have", "had": "have", "does": "do", "did": "do", "done": "do", "went": "go", "gone": "go",
+    "said": "say", "made": "make", "took": "take", "taken": "take", "came": "come", "saw": "see",
+    "seen": "see", "got": "get", "gotten": "get", "knew": "know", "known": "know", "thought": "think",
+    "told": "tell", "found": "find", "gave": "give", "given": "give", "felt": "feel", "brought": "bring",
+    "began": "begin", "begun": "begin", "kept": "keep", "held": "hold", "wrote": "write",
+    "written": "write", "stood": "stand", "heard": "hear", "meant": "mean", "met": "meet", "ran": "run",
+    "paid": "pay", "sat": "sit", "spoke": "speak", "spoken": "speak", "led": "lead", "grew": "grow",
+    "grown": "grow", "lost": "lose", "fell": "fall", "fallen": "fall", "sent": "send", "built": "build",
+    "understood": "understand", "ate": "eat", "eaten": "eat", "bought": "buy", "caught": "catch",
+    "taught": "teach", "won": "win", "chose": "choose", "chosen": "choose", "drove": "drive",
+    "driven": "drive", "broke": "break", "broken": "break", "spent": "spend", "slept": "sleep",
+    "threw": "throw", "thrown": "throw", "flew": "fly", "flown": "fly", "drew": "draw", "drawn": "draw",
+    "wore": "wear", "worn": "wear", "sold": "sell", "sang": "sing", "sung": "sing", "swam": "swim",
+    "forgot": "forget", "forgotten": "forget", "rose": "rise", "risen": "rise", "children": "child",
+    "men": "man", "women": "woman", "feet": "foot", "teeth": "tooth", "mice": "mouse", "better": "good",
+    "best": "good", "worse": "bad", "worst": "bad", "lay": "lie", "left": "leave", "became": "become",
+    "shot": "shoot", "hung": "hang", "hid": "hide", "fought": "fight", "sought": "seek", "struck": "strike",
+}
+# Suffix -> replacements tried in order, for regular inflections and derivations.
+SUFFIXES = (
+    ("ies", ("y",)), ("ied", ("y",)), ("ier", ("y",)), ("iest", ("y",)), ("ily", ("y",)),
+    ("ing", ("", "e")), ("ed", ("", "e")), ("es", ("", "e")), ("s", ("",)),
+    ("est", ("", "e")), ("er", ("", "e")), ("ly", ("", "le")),
+)
+
+
+class TextStats(NamedTuple):
+    word_count: int
+    sentence_count: int
+    reading_ease: Optional[float]  # Flesch reading ease, higher is easier
+    grade_level: Optional[float]  # Flesch-Kincaid US school grade
+    level: Optional[str]  # CEFR-style A1..C2
+    key_words: list
+
+
+def _load_ranks(path):
+    ranks = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            for word in line.split():
+                ranks.setdefault(word, len(ranks) + 1)
+    return ranks
+
+
+def _add_basic_words(ranks, path):
+    """Rank each beginner word no lower than the top of its level's band."""
+    band_top = {name: limit for limit, name in LEVEL_BANDS}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            level, *words = line.split()
+            for word in words:
+                ranks[word] = min(ranks.get(word, band_top[level]), band_top[level])
+
+
+RANKS = _load_ranks(FREQUENCY_LIST)
+UNLISTED = len(RANKS) + 1  # rank of every word the list doesn't have
+_add_basic_words(RANKS, BASIC_WORDS)
+
+
+@lru_cache(maxsize=65536)
+def lemma(word):
+    """Headword for a lowercase word form: the list's entry if any rule finds one, else the word."""
+    word = word.replace("’", "'")
+    if "'" in word:
+        word = CONTRACTIONS.get(word) or (word[:-3] if word.endswith("n't") else word.split("'")[0])
+    if word in RANKS:
+        return word
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    for suffix, replacements in SUFFIXES:
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            stem = word[:-len(suffix)]
+            for repl in replacements:
+                if stem + repl in RANKS:
+                    return stem + repl
+            # stopped, bigger: a doubled final consonant
+            if len(stem) > 3 and stem[-1] == stem[-2] and stem[:-1] in RANKS:
+                return stem[:-1]
+    return word
+
+
+def rank(headword):
+    return RANKS.get(headword, UNLISTED)
+
+
+@lru_cache(maxsize=65536)
+def syllables(word):
+    """Estimated syllable count: vowel groups, less a silent final e."""
+    count = len(_VOWELS.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee", "ye")) and count > 1:
+        count -= 1
+    return max(count, 1)
+
+
+@lru_cache(maxsize=65536)
+def _form(form):
+    """(headword, its rank, syllables, capitalized, key-word weight) for a word as written."""
+    low = form.lower()
+    head = lemma(low)
+    head_rank = rank(head)
+    # Rarer words make better key words; common, short and function words never do.
+    weight = math.log(head_rank) if head_rank > KEY_WORD_MIN_RANK and len(head) >= 4 and head not in STOPWORDS else 0
+    return head, head_rank, syllables(low), form[0].isupper(), weight
+
+
+def _findall(pattern, text):
+    """pattern.findall(text), a _CHUNK at a time. One findall over a 1 MB body holds
+    the GIL for ~50 ms; in pieces, the event loop gets a turn while a thread runs this."""
+    found, start = [], 0
+    while start < len(text):
+        cut = _CUT.search(text, start + _CHUNK) if start + _CHUNK < len(text) else None
+        end = cut.end() if cut else len(text)
+        found += pattern.findall(text, start, end)
+        start = end
+    return found
+
+
+def plain_text(body):
+    return html.unescape(_TAG.sub(" ", body or ""))
+
+
+def _level(by_rank, words_per_sentence):
+    """CEFR-style level from how many of a text's (non-name) words have each frequency rank."""
+    total, covered = sum(by_rank.values()), 0
+    for needed in sorted(by_rank):
+        covered += by_rank[needed]
+        if covered >= total * COVERAGE:
+            break
+    if needed < UNLISTED:
+        level = next((name for limit, name in LEVEL_BANDS if needed <= limit), "B2")
+    else:
+        level = "C1" if by_rank[UNLISTED] / total <= C1_MAX_UNLISTED else "C2"
+    if words_per_sentence > LONG_SENTENCE_WORDS:
+        level = LEVELS[min(LEVELS.index(level) + 1, len(LEVELS) - 1)]
+    return level
+
+
+def analyze(body):
+    """TextStats for an article body (HTML or plain text)."""
+    tokens = _findall(_WORD, plain_text(body))
+    if not tokens:
+        return TextStats(0, 0, None, None, None, [])
+    sentences = max(len(_findall(_SENTENCE_END, body or "")), 1)
+
+    heads = {}  # headword -> [occurrences, capitalized occurrences, rank, weight], in order of first use
+    syllable_total = 0
+    for form, n in Counter(tokens).items():
+        head, head_rank, syl, capitalized, weight = _form(form)
+        syllable_total += syl * n
+        seen = heads.get(head)
+        if seen is None:
+            seen = heads[head] = [0, 0, head_rank, weight]
+        seen[0] += n
+        if capitalized:
+            seen[1] += n
+    by_rank, candidates = Counter(), []
+    for i, (head, (n, capitalized, head_rank, weight)) in enumerate(heads.items()):
+        if capitalized == n:
+            if head_rank == UNLISTED:
+                continue  # a name, which says nothing about the text's difficulty
+            weight = 0  # days, months: listed, but not worth defining
+        by_rank[head_rank] += n
+        if weight:
+            candidates.append((-weight * (1 + math.log(n)), i, head))
+
+    words = len(tokens)
+    words_per_sentence = words / sentences
+    syllables_per_word = syllable_total / words
+    reading_ease = 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word
+    grade_level = 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59
+
+    level = _level(by_rank, words_per_sentence) if sum(by_rank.values()) >= MIN_LEVEL_WORDS else None
+
+    return TextStats(words, sentences, round(reading_ease, 1), round(max(grade_level, 0), 1),
+                     level, [head for _, _, head in heapq.nsmallest(KEY_WORDS, candidates)])
+
+
+def article_columns(body):
+    """The Article column values analyze() fills in."""
+    stats = analyze(body)
+    return {"word_count": stats.word_count, "reading_ease": stats.reading_ease,
+            "grade_level": stats.grade_level, "level": stats.level, "key_words": json.dumps(stats.key_words),
+            "analysis_version": VERSION}
@@ -0,0 +1,163 @@
+"""Drive the OpenRouter resilience layer through injected upstream faults.
+
+Starts bench/stub_openrouter.py in-process and sends rounds of distinct
+ask_about_article_async calls while the stub is healthy, flaky, down, hanging
+and finally healthy again, waiting out an open breaker between phases. For each phase it prints how many calls got a real
+answer, their latency, how many requests reached the stub, and the
+resilience counters, as JSON. Once the breaker is open, calls should fail in
+well under a millisecond without reaching the stub.
+
+Finally it checks that a failure isn't reused: with the cross-process lease
+table on, an Ask-AI question and an article summary that failed (503 after
+retries, or a 400 that yields no content) must succeed when repeated
+identically once the stub has recovered, and that a streamed answer cut off
+after its first word raises instead of ending as if complete. Exits non-zero
+if they don't.
+
+    python bench/ai_faults.py --calls 40
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ai_throughput import _free_port, _start_stub
+
+PHASES = [
+    ("healthy", {"error_rate": 0.0, "hang_rate": 0.0}),
+    ("flaky", {"error_rate": 0.3, "hang_rate": 0.0}),
+    ("outage", {"error_rate": 1.0, "hang_rate": 0.0}),
+    ("hanging", {"error_rate": 0.0, "hang_rate": 1.0}),
+    ("recovered", {"error_rate": 0.0, "hang_rate": 0.0}),  # the half-open trial closes the breaker
+    ("after_recovery", {"error_rate": 0.0, "hang_rate": 0.0}),
+]
+
+
+def _ms(times, q):
+    times = sorted(times)
+    return round(times[min(int(len(times) * q), len(times) - 1)] * 1000, 2)
+
+
+async def _phase(ai_helper, stub, name, calls, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    times, answers = [], []
+    before = stub.stats["requests"]
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            answers.append(await ai_helper.ask_about_article_async("T", "Body", f"{name} question {i}?"))
+            times.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    ok = sum(a not in (ai_helper.ASK_ERROR, ai_helper.ASK_UNAVAILABLE) for a in answers)
+    return {"ok": ok, "calls": calls, "p50_ms": _ms(times, 0.5), "max_ms": _ms(times, 1.0),
+            "upstream_requests": stub.stats["requests"] - before}
+
+
+async def _wait_for_breaker(resilience):
+    if resilience.stats()["breaker_state"] == "open":
+        await asyncio.sleep(resilience.BREAKER_RESET_SECONDS)
+
+
+async def _repeat_after_failure(ai_helper, resilience, singleflight, stub):
+    """For each error status: does an identical call after a failed one reach OpenRouter again?"""
+    failed = (ai_helper.ASK_ERROR, ai_helper.ASK_UNAVAILABLE)
+    singleflight.SHARED = True
+    out = {}
+    try:
+        for status in (503, 400):
+            question, body = f"Repeat after {status}?", f"Body {status}"
+            stub.faults.update(error_rate=1.0, error_status=status)
+            await _wait_for_breaker(resilience)
+            first = await ai_helper.ask_about_article_async("T", "Body", question)
+            first_summary = await ai_helper.generate_article_summary_async("T", body)
+            stub.faults.update(error_rate=0.0)
+            await _wait_for_breaker(resilience)
+            again = await ai_helper.ask_about_article_async("T", "Body", question)
+            again_summary = await ai_helper.generate_article_summary_async("T", body)
+            out[status] = {
+                "ask_failed_first": first in failed, "ask_ok_after_recovery": again not in failed,
+                "summary_failed_first": not first_summary.get("summary"),
+                "summary_ok_after_recovery": bool(again_summary.get("summary")),
+            }
+    finally:
+        singleflight.SHARED = False
+    return out
+
+
+async def _stream_cut_off(ai_helper, stub):
+    """Does a stream that closes without [DONE] raise after the part it did send?"""
+    stub.faults.update(truncate_rate=1.0)
+    pieces = []
+    try:
+        async for piece in ai_helper.ask_about_article_stream("T", "Body", "Cut off?"):
+            pieces.append(piece)
+        raised = False
+    except Exception:
+        raised = True
+    finally:
+        stub.faults.update(truncate_rate=0.0)
+    return {"partial_answer": "".join(pieces), "raised": raised}
+
+
+async def _run(args):
+    import stub_openrouter as stub
+    from app import ai_helper, resilience, singleflight
+
+    out = {}
+    for name, faults in PHASES:
+        stub.faults.update(faults)
+        await _wait_for_breaker(resilience)
+        out[name] = await _phase(ai_helper, stub, name, args.calls, args.concurrency)
+        out[name]["resilience"] = resilience.stats()
+    out["repeat_after_failure"] = await _repeat_after_failure(ai_helper, resilience, singleflight, stub)
+    await _wait_for_breaker(resilience)
+    out["stream_cut_off"] = await _stream_cut_off(ai_helper, stub)
+    await ai_helper.close_async_client()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=40, help="calls per phase")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=0.5, help="OpenRouter timeout in seconds")
+    args = parser.parse_args()
+
+    port = _free_port()
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",  # for the llm_flights lease table
+        "OPENROUTER_URL": f"http://127.0.0.1:{port}/api/v1/chat/completions",
+        "OPENROUTER_TIMEOUT": str(args.timeout),
+        "OPENROUTER_BACKOFF_SECONDS": "0.05",
+        "OPENROUTER_BREAKER_RESET_SECONDS": "2",
+        "SINGLEFLIGHT_SHARED": "0",
+        "OPENROUTER_RATE": "0",  # the global limit would hide the faults being measured
+    })
+    _start_stub(port)
+    from app.database import init_db
+
+    init_db()
+    try:
+        out = asyncio.run(_run(args))
+    finally:
+        os.unlink(db_path)
+    print(json.dumps(out, indent=2))
+    if not all(all(r.values()) for r in out["repeat_after_failure"].values()):
+        sys.exit("a failed call was reused for an identical call after recovery")
+    if not out["stream_cut_off"]["raised"]:
+        sys.exit("a stream cut off before [DONE] ended as if the answer were complete")
+
+
+if __name__ == "__main__":
+    main()
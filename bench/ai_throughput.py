@@ -0,0 +1,74 @@
+"""Measure OpenRouter client throughput against the local stub server.
+
+Starts bench/stub_openrouter.py in-process, then issues --calls concurrent
+ask_about_article_async calls with distinct questions through the pooled
+async client, and prints the results as JSON. With the stub's fixed latency,
+throughput is bounded by OPENROUTER_MAX_CONCURRENCY.
+
+    python bench/ai_throughput.py --calls 200 --latency 0.2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_stub(port):
+    import stub_openrouter
+    server = uvicorn.Server(uvicorn.Config(stub_openrouter.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def _run_async(ai_helper, calls):
+    start = time.perf_counter()
+    await asyncio.gather(*(ai_helper.ask_about_article_async("T", "Body", f"Q{i}?") for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    await ai_helper.close_async_client()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenRouter client throughput against the stub server")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub response delay in seconds")
+    args = parser.parse_args()
+
+    port = _free_port()
+    os.environ["STUB_LATENCY"] = str(args.latency)
+    os.environ["OPENROUTER_URL"] = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+    os.environ["OPENROUTER_RATE"] = "0"  # measure the client, not the rate limit
+    os.environ["SINGLEFLIGHT_SHARED"] = "0"
+    _start_stub(port)
+
+    from app import ai_helper
+
+    async_s = asyncio.run(_run_async(ai_helper, args.calls))
+    print(json.dumps({
+        "calls": args.calls,
+        "stub_latency_s": args.latency,
+        "max_concurrency": ai_helper.OPENROUTER_MAX_CONCURRENCY,
+        "async": {"seconds": round(async_s, 3), "rps": round(args.calls / async_s, 1)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Check which question pairs the Ask-AI answer cache treats as the same.
+
+For each pair, stores an answer to the first question and looks up the
+second. DIFFERENT pairs ask for a different answer and must miss; SAME pairs
+are rephrasings that should be served from the similarity tier. Prints the
+outcome and the n-gram similarity of each pair as JSON, and exits non-zero
+if any DIFFERENT pair is answered from the cache or any SAME pair misses.
+
+    python bench/answer_cache.py
+"""
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import answer_cache  # noqa: E402
+
+DIFFERENT = [
+    ("What is the main idea of paragraph 2?", "What is the main idea of paragraph 3?"),
+    ("What does the word economy mean in this text?", "What does the word economics mean in this text?"),
+    ("Is the author for or against the policy?", "Is the author against the policy?"),
+    ("When did the war start?", "Where did the war start?"),
+    ("Why is the river polluted?", "Why isn't the river polluted?"),
+    ("Does the dog chase the cat?", "Does the cat chase the dog?"),
+]
+SAME = [
+    ("What does the word economy mean?", "what does economy mean"),
+    ("Please explain what 'sustainable' means", "What does sustainable mean?"),
+    ("Who is the main character?", "Who's the main character??"),
+    ("What are the author's main arguments?", "What are the author's main argument?"),
+]
+
+
+def _check(pairs, article_id, should_hit):
+    out = []
+    for i, (first, second) in enumerate(pairs):
+        answer_cache.store(article_id, "hash", first, f"answer {i}")
+        entry = answer_cache._articles[article_id]
+        score = answer_cache._most_similar(entry, answer_cache.normalize(second))[1]
+        hit = answer_cache.lookup(article_id, "hash", second) is not None
+        out.append({"cached": first, "asked": second, "similarity": round(score, 3), "hit": hit, "ok": hit == should_hit})
+        article_id += 1
+    return out
+
+
+def main():
+    report = {"threshold": answer_cache.SIMILARITY_THRESHOLD,
+              "different": _check(DIFFERENT, 1, False),
+              "same": _check(SAME, 1000, True)}
+    print(json.dumps(report, indent=2))
+    wrong = [r for r in report["different"] + report["same"] if not r["ok"]]
+    if wrong:
+        sys.exit(f"{len(wrong)} question pair(s) matched wrongly")
+
+
+if __name__ == "__main__":
+    main()
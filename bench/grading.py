@@ -0,0 +1,85 @@
+"""Time grading a submitted test against its answer key.
+
+Seeds a throwaway SQLite database with one test of --questions questions and
+times the two steps submit_test uses to grade: the answer-key query and the
+comparison with the submitted answers. Prints JSON.
+
+    python bench/grading.py --questions 200 --runs 500
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _summary(times):
+    times = sorted(times)
+    return {
+        "p50_ms": round(times[len(times) // 2] * 1000, 4),
+        "p95_ms": round(times[int(len(times) * 0.95)] * 1000, 4),
+    }
+
+
+async def _measure(crud, test_id, answers, runs):
+    from app.database import AsyncSessionLocal
+
+    query, compare = [], []
+    async with AsyncSessionLocal() as db:
+        for _ in range(runs):
+            start = time.perf_counter()
+            key = await crud.get_answer_key(db, test_id)
+            mid = time.perf_counter()
+            correct = len(key.items() & answers.items())
+            end = time.perf_counter()
+            query.append(mid - start)
+            compare.append(end - mid)
+    return correct, query, compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    try:
+        from app import models, crud
+        from app.database import SessionLocal, init_db
+
+        init_db()
+        db = SessionLocal()
+        test = models.Test(title="Bench", description="Seeded")
+        test.questions = [
+            models.Question(text=f"Q{i}", correct_index=i % 4,
+                            choices=[models.QuestionChoice(position=k, text=c) for k, c in enumerate("abcd")])
+            for i in range(args.questions)
+        ]
+        db.add(test)
+        db.commit()
+        answers = {q.id: random.randrange(4) for q in test.questions}
+        test_id = test.id
+        db.close()
+
+        correct, query, compare = asyncio.run(_measure(crud, test_id, answers, args.runs))
+        print(json.dumps({
+            "questions": args.questions,
+            "correct": correct,
+            "answer_key_query": _summary(query),
+            "compare": _summary(compare),
+        }, indent=2))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Load-test the app with a mixed workload against the stub LLM backend.
+
+Seeds a throwaway SQLite database (articles with comments and stored AI
+analysis, collections, tests), starts bench/stub_openrouter.py and the app
+under uvicorn as subprocesses, then keeps --concurrency virtual users busy for
+--duration seconds with a weighted mix of page views, Ask-AI questions and
+test submissions. Prints throughput and latency percentiles per operation as
+JSON, stamped with the current commit so runs can be compared.
+
+    python bench/load.py --duration 30 --concurrency 32 --workers 2
+    python bench/load.py --stub-latency 2 --stub-error-rate 0.2 --output run.json
+
+Other settings (PAGE_CACHE, JOB_WORKERS, OPENROUTER_RETRIES, ...) are passed
+through from the environment.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ai_throughput import _free_port
+
+DEFAULT_MIX = "index=25,articles=10,article=35,ask=10,test=5,submit=15"
+QUESTIONS = [f"What does paragraph {i} of this article mean?" for i in range(40)]
+WORDS = ("grammar vocabulary reading listening practice sentence tense verb noun phrase idiom "
+         "pronunciation conversation travel business culture history science story").split()
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _records(args, rng):
+    for c in range(args.collections):
+        yield {"type": "collection", "id": c + 1, "title": f"Collection {c}", "description": _text(rng, 12)}
+    for a in range(args.articles):
+        body = "\n\n".join(_text(rng, rng.randint(40, 120)) for _ in range(rng.randint(3, 8)))
+        cols = rng.sample(range(1, args.collections + 1), k=min(args.collections, rng.randint(0, 2)))
+        yield {"type": "article", "title": f"Article {a}: {_text(rng, 4)}", "body": body,
+               "author": f"Author {a % 40}", "collection_ids": cols}
+    for t in range(args.tests):
+        questions = [{"text": _text(rng, 10), "choices": [_text(rng, 3) for _ in range(4)],
+                      "correct_index": rng.randrange(4)} for _ in range(rng.randint(5, 20))]
+        yield {"type": "test", "title": f"Test {t}", "description": _text(rng, 10), "questions": questions}
+
+
+def seed(args):
+    """Fill the database named by DATABASE_URL; returns (article ids, {test_id: [question ids]})."""
+    from sqlalchemy import insert, select
+    from app import bulk, models, ai_cache
+    from app.database import SessionLocal, init_db
+
+    rng = random.Random(args.seed)
+    init_db()
+
+    async def lines():
+        for record in _records(args, rng):
+            yield json.dumps(record)
+
+    async def run():
+        from app.database import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            await bulk.import_lines(db, lines())
+
+    asyncio.run(run())
+
+    db = SessionLocal()
+    try:
+        articles = db.execute(select(models.Article.id, models.Article.title, models.Article.body)).all()
+        db.execute(insert(models.Comment), [
+            {"article_id": a.id, "author": f"Reader {j}", "text": _text(rng, 15)}
+            for a in articles for j in range(rng.randint(0, args.comments * 2))])
+        db.execute(insert(models.ArticleAnalysis), [
+            {"article_id": a.id, "content_hash": ai_cache.content_hash(a.title, a.body), "summary": _text(rng, 30),
+             "vocabulary": json.dumps([{"word": w, "definition": _text(rng, 6)} for w in rng.sample(WORDS, 5)])}
+            for a in articles])
+        db.commit()
+        tests = {}
+        for question_id, test_id in db.execute(select(models.Question.id, models.Question.test_id)):
+            tests.setdefault(test_id, []).append(question_id)
+        return [a.id for a in articles], tests
+    finally:
+        db.close()
+
+
+def _op(name, rng, article_ids, tests):
+    """(method, url, form data) for one request of the given kind."""
+    if name == "index":
+        return "GET", "/", None
+    if name == "articles":
+        return "GET", "/articles", None
+    if name == "article":
+        return "GET", f"/articles/{rng.choice(article_ids)}", None
+    if name == "ask":
+        return "POST", f"/articles/{rng.choice(article_ids)}/ask-ai", {"question": rng.choice(QUESTIONS)}
+    test_id = rng.choice(list(tests))
+    if name == "test":
+        return "GET", f"/tests/{test_id}", None
+    answers = {str(q): rng.randrange(4) for q in tests[test_id] if rng.random() < 0.9}
+    return "POST", f"/tests/{test_id}/submit", {"answers": json.dumps(answers)}
+
+
+def _percentiles(times):
+    times = sorted(times)
+    pick = lambda q: round(times[min(int(len(times) * q), len(times) - 1)] * 1000, 2)
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(times[-1] * 1000, 2)}
+
+
+async def drive(base, args, mix, article_ids, tests):
+    names, weights = zip(*mix.items())
+    results = {name: {"times": [], "errors": 0} for name in names}
+    recording = False
+
+    async def user(i):
+        rng = random.Random(args.seed * 1000 + i)
+        async with httpx.AsyncClient(base_url=base, timeout=args.request_timeout) as client:
+            while not stop.is_set():
+                name = rng.choices(names, weights)[0]
+                method, url, data = _op(name, rng, article_ids, tests)
+                start = time.perf_counter()
+                try:
+                    r = await client.request(method, url, data=data)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if recording:
+                    results[name]["times"].append(time.perf_counter() - start)
+                    results[name]["errors"] += not ok
+
+    stop = asyncio.Event()
+    users = [asyncio.create_task(user(i)) for i in range(args.concurrency)]
+    await asyncio.sleep(args.warmup)
+    recording = True
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*users)
+
+    report, all_times, errors = {}, [], 0
+    for name, r in results.items():
+        if r["times"]:
+            report[name] = dict(requests=len(r["times"]), errors=r["errors"],
+                                rps=round(len(r["times"]) / elapsed, 1), **_percentiles(r["times"]))
+            all_times += r["times"]
+            errors += r["errors"]
+    total = dict(requests=len(all_times), errors=errors, rps=round(len(all_times) / elapsed, 1),
+                 **(_percentiles(all_times) if all_times else {}))
+    return total, report
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), text=True).strip()
+    except Exception:
+        return None
+
+
+def _wait_until_up(url, proc):
+    for _ in range(600):
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{url} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds first")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weights per operation")
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=5, help="average comments per article")
+    parser.add_argument("--collections", type=int, default=50)
+    parser.add_argument("--tests", type=int, default=200)
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+    mix = {k: float(v) for k, v in (part.split("=") for part in args.mix.split(","))}
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    stub_port, app_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        OPENROUTER_URL=f"http://127.0.0.1:{stub_port}/api/v1/chat/completions",
+        AI_CLIENT_RATE="0",  # every virtual user shares one IP
+    )
+    procs = []  # their output goes to stderr so stdout is just the report
+    try:
+        seed_start = time.perf_counter()
+        article_ids, tests = seed(args)
+        seed_s = time.perf_counter() - seed_start
+
+        procs.append(subprocess.Popen(
+            [sys.executable, str(ROOT / "bench" / "stub_openrouter.py"), "--port", str(stub_port),
+             "--latency", str(args.stub_latency), "--error-rate", str(args.stub_error_rate)], env=env, stdout=sys.stderr))
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning"], cwd=str(ROOT), env=env, stdout=sys.stderr))
+        base = f"http://127.0.0.1:{app_port}"
+        _wait_until_up(f"http://127.0.0.1:{stub_port}/docs", procs[0])
+        _wait_until_up(base + "/tests", procs[1])
+
+        total, per_op = asyncio.run(drive(base, args, mix, article_ids, tests))
+        report = {
+            "commit": _commit(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "seed_seconds": round(seed_s, 2),
+            "total": total,
+            "operations": per_op,
+        }
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            Path(args.output).write_text(text + "\n")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Summarize and question articles of growing length against the stub LLM.
+
+Starts bench/stub_openrouter.py in-process with a per-token latency, so long
+prompts are slow as they are with a real model. For each article length it
+times generate_article_summary_async and ask_about_article_async, chunked and
+with the whole article in one prompt, and counts the upstream requests and
+the largest prompt the stub received. Chunked, the largest prompt stays flat
+once articles exceed SUMMARY_CHUNK_TOKENS / ASK_CONTEXT_TOKENS, and the
+Ask-AI context still contains the one paragraph the question is about.
+Prints JSON.
+
+    python bench/long_articles.py --words 1000 10000 100000 --latency-per-ktoken 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ai_throughput import _free_port, _start_stub
+
+WORDS = ("grammar vocabulary reading listening practice sentence tense verb noun phrase idiom "
+         "pronunciation conversation travel business culture history science story").split()
+QUESTION = "Why did the harbour lights fail?"
+
+
+def _article(words, rng):
+    paragraphs, left = [], words
+    while left > 0:
+        n = min(left, rng.randint(60, 160))
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(n // 12 + 1)]
+        paragraphs.append(" ".join(sentences))
+        left -= n
+    # One paragraph the question below is about, somewhere in the middle.
+    paragraphs.insert(len(paragraphs) // 2, "The lighthouse keeper explained why the harbour lights failed in winter.")
+    return "\n\n".join(paragraphs)
+
+
+async def _measure(stub, call):
+    before = stub.stats["requests"]
+    stub.stats["max_prompt_chars"] = 0
+    start = time.perf_counter()
+    result = await call()
+    return result, {"seconds": round(time.perf_counter() - start, 3),
+                    "upstream_requests": stub.stats["requests"] - before,
+                    "max_prompt_chars": stub.stats["max_prompt_chars"]}
+
+
+async def _run(stub, ai_helper, lengths):
+    rng = random.Random(1)
+    limits = (ai_helper.SUMMARY_CHUNK_TOKENS, ai_helper.ASK_CONTEXT_TOKENS)
+    out = {}
+    for words in lengths:
+        title, body = f"Article {words}", _article(words, rng)
+        row = {"chars": len(body)}
+        for mode in ("chunked", "whole_article"):
+            # The whole-article baseline is the behaviour before chunking: one prompt with everything.
+            ai_helper.SUMMARY_CHUNK_TOKENS, ai_helper.ASK_CONTEXT_TOKENS = limits if mode == "chunked" else (10 ** 9, 10 ** 9)
+            summary, row[f"summary_{mode}"] = await _measure(
+                stub, lambda: ai_helper.generate_article_summary_async(title, body))
+            row[f"summary_{mode}"]["ok"] = bool(summary.get("summary"))
+            _, row[f"ask_{mode}"] = await _measure(
+                stub, lambda: ai_helper.ask_about_article_async(title, body, QUESTION))
+            row[f"ask_{mode}"]["context_has_answer"] = "lighthouse" in ai_helper._ask_prompt(title, body, QUESTION)
+        ai_helper.SUMMARY_CHUNK_TOKENS, ai_helper.ASK_CONTEXT_TOKENS = limits
+        out[words] = row
+    await ai_helper.close_async_client()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per call")
+    parser.add_argument("--latency-per-ktoken", type=float, default=0.2, help="stub seconds per 1000 prompt tokens")
+    args = parser.parse_args()
+
+    port = _free_port()
+    os.environ.update({
+        "OPENROUTER_URL": f"http://127.0.0.1:{port}/api/v1/chat/completions",
+        "OPENROUTER_RATE": "0",
+        "SINGLEFLIGHT_SHARED": "0",
+        "OPENROUTER_TIMEOUT": "600",  # the unchunked baseline of a huge article is slow on purpose
+        "STUB_LATENCY": str(args.latency),
+        "STUB_LATENCY_PER_KTOKEN": str(args.latency_per_ktoken),
+    })
+    import stub_openrouter as stub
+    from app import ai_helper
+
+    _start_stub(port)
+    print(json.dumps(asyncio.run(_run(stub, ai_helper, args.words)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
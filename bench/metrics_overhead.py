@@ -0,0 +1,109 @@
+"""Measure what the /metrics instrumentation costs per request.
+
+Two measurements, printed as JSON:
+
+- direct: the time the middleware adds around an empty ASGI app and the time
+  the SQL hooks add per statement, measured in a loop. Per page, that cost for
+  its query budget (bench/query_counts.py) relative to the uninstrumented p50.
+- end_to_end: the page_cache benchmark's in-process runner against the
+  uncached pages with METRICS=0 and METRICS=1, best p50 over several rounds.
+  Differences of a few percent are within run-to-run noise here; the direct
+  figures are the ones to compare across commits.
+
+    python bench/metrics_overhead.py --requests 500 --rounds 3
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+
+from page_cache import RUNNER, PAGES
+from query_counts import BUDGETS
+
+
+def _per_call_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def direct_costs(n=20000):
+    """Microseconds the middleware adds per request and the SQL hooks add per statement."""
+    from app import metrics
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def requests(app):
+        scope = {"type": "http", "method": "GET"}
+        start = time.perf_counter()
+        for _ in range(n):
+            await app(scope, None, send)
+        return time.perf_counter() - start
+
+    bare = asyncio.run(requests(endpoint))
+    wrapped = asyncio.run(requests(metrics.MetricsMiddleware(endpoint)))
+
+    class Connection:
+        info = {}
+
+    def statement(conn=Connection()):
+        metrics._before_cursor_execute(conn, None, None, None, None, False)
+        metrics._after_cursor_execute(conn, None, None, None, None, False)
+
+    return (wrapped - bare) / n * 1e6, _per_call_us(statement, n)
+
+
+def run(enabled, args):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", PAGE_CACHE="0", JOB_WORKERS="0",
+               METRICS="1" if enabled else "0")
+    code = RUNNER.format(root=str(HERE.parent), here=str(HERE), size=args.size, pages=PAGES,
+                         requests=args.requests, conditional=False)
+    try:
+        out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    finally:
+        os.unlink(path)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per page")
+    parser.add_argument("--size", type=int, default=30, help="rows of each kind to seed")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per setting; the best p50 counts")
+    args = parser.parse_args()
+
+    best = {False: {}, True: {}}
+    for _ in range(args.rounds):
+        for enabled in (False, True):  # interleaved, so drift in machine load hits both
+            for page, r in run(enabled, args).items():
+                best[enabled][page] = min(best[enabled].get(page, r["p50_ms"]), r["p50_ms"])
+    request_us, statement_us = direct_costs()
+    direct = {"middleware_us_per_request": round(request_us, 2), "sql_hooks_us_per_statement": round(statement_us, 2)}
+    for page in PAGES:
+        cost_ms = (request_us + statement_us * BUDGETS[page]) / 1000
+        direct[page] = {"added_ms": round(cost_ms, 4), "overhead_pct": round(cost_ms / best[False][page] * 100, 2)}
+    end_to_end = {page: {"off_p50_ms": best[False][page], "on_p50_ms": best[True][page],
+                         "overhead_pct": round((best[True][page] / best[False][page] - 1) * 100, 1)}
+                  for page in PAGES}
+    print(json.dumps({"direct": direct, "end_to_end": end_to_end}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare page latency with the rendered-page cache on and off.
+
+Seeds a throwaway SQLite database, then requests each cached page repeatedly
+in-process (no network), once with PAGE_CACHE=0 and once with PAGE_CACHE=1,
+plus a conditional-GET run that sends back the ETag. Prints JSON.
+
+    python bench/page_cache.py --requests 300 --size 30
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+PAGES = ["/", "/articles", "/articles/1", "/collections/1", "/tests/1"]
+
+RUNNER = """
+import json, sys, time
+sys.path.insert(0, {root!r}); sys.path.insert(0, {here!r})
+from fastapi.testclient import TestClient
+from app import main, models, ai_cache
+from app.database import SessionLocal
+from query_counts import _seed
+db = SessionLocal()
+_seed(db, models, {size})
+# article_detail pages waiting for AI analysis are never cached
+article = db.get(models.Article, 1)
+db.add(models.ArticleAnalysis(article_id=1, content_hash=ai_cache.content_hash(article.title, article.body),
+                              summary="Summary", vocabulary="[]"))
+db.commit()
+db.close()
+client = TestClient(main.app).__enter__()  # one event loop for every request
+out = {{}}
+for page in {pages!r}:
+    etag = client.get(page).headers.get("etag")
+    headers = {{"If-None-Match": etag}} if {conditional} and etag else {{}}
+    times = []
+    for _ in range({requests}):
+        start = time.perf_counter()
+        client.get(page, headers=headers)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    out[page] = {{"p50_ms": round(times[len(times) // 2], 3), "p95_ms": round(times[int(len(times) * 0.95)], 3),
+                 "rps": round(len(times) / (sum(times) / 1000), 1)}}
+print(json.dumps(out))
+"""
+
+
+def run(enabled, conditional, args):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", PAGE_CACHE="1" if enabled else "0", JOB_WORKERS="0")
+    code = RUNNER.format(root=str(HERE.parent), here=str(HERE), size=args.size, pages=PAGES,
+                         requests=args.requests, conditional=conditional)
+    try:
+        out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    finally:
+        os.unlink(path)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendered-page cache benchmark")
+    parser.add_argument("--requests", type=int, default=300, help="requests per page")
+    parser.add_argument("--size", type=int, default=30, help="rows of each kind to seed")
+    args = parser.parse_args()
+    print(json.dumps({
+        "uncached": run(False, False, args),
+        "cached": run(True, False, args),
+        "conditional_304": run(True, True, args),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
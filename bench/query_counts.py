@@ -0,0 +1,111 @@
+"""Check that every page runs a fixed number of SQL queries.
+
+Seeds two throwaway SQLite databases, one small and one ten times larger,
+renders each page against both, and fails if a page exceeds its budget or
+issues more queries on the larger data set (an N+1 regression).
+
+    python bench/query_counts.py
+    python bench/query_counts.py --database-url postgresql://localhost/scratch
+
+With --database-url the pages are measured against that database instead.
+Every table in it is dropped before each run, so point it at a scratch database.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Queries allowed per page on a page-cache miss (cached pages add one query
+# for their version counters). article_detail includes the analysis lookup
+# and the job enqueue for an article without analysis; test_detail loads
+# questions and their choices with one query each.
+BUDGETS = {
+    "/": 4,
+    "/articles": 2,
+    "/articles/1": 6,
+    "/collections": 1,
+    "/collections/1": 3,
+    "/tests": 1,
+    "/tests/1": 4,
+}
+
+
+def _seed(db, models, n):
+    col = models.Collection(title="Collection", description="Seeded")
+    db.add(col)
+    for i in range(n):
+        article = models.Article(title=f"Article {i}", body="Body " * 50, author="Bench", collections=[col])
+        article.comments = [models.Comment(author="Reader", text=f"Comment {j}") for j in range(n)]
+        db.add(article)
+    for i in range(n):
+        test = models.Test(title=f"Test {i}", description="Seeded")
+        test.questions = [models.Question(text=f"Q{j}", correct_index=0,
+                                         choices=[models.QuestionChoice(position=k, text=c) for k, c in enumerate("abc")]) for j in range(n)]
+        db.add(test)
+    db.commit()
+
+
+def measure(n, database_url=None):
+    """Query count per page for a database seeded with `n` of everything."""
+    path = None
+    if database_url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{path}"
+    # No job workers: a background job's queries would land in the counts.
+    env = dict(os.environ, DATABASE_URL=database_url, JOB_WORKERS="0")
+    code = f"""
+import json, sys
+sys.path.insert(0, {str(Path(__file__).resolve().parent.parent)!r})
+sys.path.insert(0, {str(Path(__file__).resolve().parent)!r})
+from app import models
+from app.database import engine
+models.Base.metadata.drop_all(engine)
+from fastapi.testclient import TestClient
+from app import main, models
+from app.database import SessionLocal, count_queries
+from query_counts import _seed, BUDGETS
+db = SessionLocal()
+_seed(db, models, {n})
+db.close()
+client = TestClient(main.app).__enter__()  # one event loop for every request
+counts = {{}}
+for page in BUDGETS:
+    with count_queries() as statements:
+        assert client.get(page).status_code == 200, page
+    counts[page] = len(statements)
+print(json.dumps(counts))
+"""
+    import subprocess
+    try:
+        out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    finally:
+        if path:
+            os.unlink(path)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="measure against this (scratch) database instead of SQLite")
+    args = parser.parse_args()
+    small, large = measure(3, args.database_url), measure(30, args.database_url)
+    failures = []
+    for page, budget in BUDGETS.items():
+        status = "ok"
+        if large[page] > budget:
+            status = f"over budget ({budget})"
+        elif large[page] != small[page]:
+            status = "grows with data (N+1)"
+        if status != "ok":
+            failures.append(page)
+        print(f"{page:<18} small={small[page]:<3} large={large[page]:<3} {status}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
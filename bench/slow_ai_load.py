@@ -0,0 +1,120 @@
+"""Check that slow AI calls don't starve ordinary page views.
+
+Starts the stub OpenRouter server with a long delay and the app under uvicorn
+(one worker, throwaway SQLite database), then measures page-view latency twice:
+on an idle server, and while --ai-calls Ask-AI requests are waiting on the
+stub. On a non-blocking request path the two should be close. Prints JSON.
+
+    python bench/slow_ai_load.py --ai-calls 50 --latency 3 --views 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from ai_throughput import _free_port, _start_stub
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES = ["/articles", "/tests", "/collections"]
+
+
+def _summary(times):
+    times = sorted(times)
+    return {
+        "p50_ms": round(times[len(times) // 2] * 1000, 1),
+        "p95_ms": round(times[int(len(times) * 0.95)] * 1000, 1),
+        "max_ms": round(times[-1] * 1000, 1),
+    }
+
+
+async def _views(client, n, concurrency):
+    times = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            r = await client.get(PAGES[i % len(PAGES)])
+            r.raise_for_status()
+            times.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return times
+
+
+async def _run(base, args):
+    async with httpx.AsyncClient(base_url=base, timeout=args.latency * 10 + 30) as client:
+        r = await client.post("/articles/create", data={"title": "Load", "body": "Some text " * 50})
+        article = r.headers["location"]
+        idle = await _views(client, args.views, args.concurrency)
+
+        # Distinct questions, so neither the answer cache nor single-flight collapses them.
+        ai = [asyncio.create_task(client.post(f"{article}/ask-ai", data={"question": f"Question {i}?"}))
+              for i in range(args.ai_calls)]
+        await asyncio.sleep(min(args.latency / 4, 0.5))  # let them reach the stub
+        busy_start = time.perf_counter()
+        busy = await _views(client, args.views, args.concurrency)
+        busy_s = time.perf_counter() - busy_start
+        still_waiting = sum(not t.done() for t in ai)
+        answers = await asyncio.gather(*ai)
+    return {
+        "ai_calls": args.ai_calls,
+        "stub_latency_s": args.latency,
+        "views": args.views,
+        "idle": _summary(idle),
+        "during_ai": dict(_summary(busy), seconds=round(busy_s, 3), ai_calls_still_waiting=still_waiting),
+        "ai_ok": sum(a.status_code == 200 for a in answers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ai-calls", type=int, default=50, help="concurrent Ask-AI requests held open")
+    parser.add_argument("--latency", type=float, default=3.0, help="stub response delay in seconds")
+    parser.add_argument("--views", type=int, default=200, help="page views per phase")
+    parser.add_argument("--concurrency", type=int, default=10, help="page views in flight at once")
+    args = parser.parse_args()
+
+    stub_port, app_port = _free_port(), _free_port()
+    os.environ["STUB_LATENCY"] = str(args.latency)
+    _start_stub(stub_port)
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{path}",
+        OPENROUTER_URL=f"http://127.0.0.1:{stub_port}/api/v1/chat/completions",
+        OPENROUTER_MAX_CONCURRENCY=str(max(args.ai_calls, 1)),
+        PAGE_CACHE="0",  # measure the database path, not cached HTML
+        AI_CLIENT_RATE="0",  # every Ask-AI call comes from this one client
+        OPENROUTER_RATE="0",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+    base = f"http://127.0.0.1:{app_port}"
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(base + "/tests")
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+        print(json.dumps(asyncio.run(_run(base, args)), indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Local stand-in for the OpenRouter chat completions API.
+
+Answers with canned content shaped like what ai_helper expects for each
+prompt type, after an optional artificial delay, so the app can be tested
+and benchmarked without the network or an API key. Faults can be injected:
+a share of requests answered with an error status, left hanging, or (for
+streams) cut off after the first word without [DONE]. Change
+them at runtime with POST /stub/faults, e.g. {"error_rate": 1.0}.
+
+    python bench/stub_openrouter.py --port 9000 --latency 0.5 --error-rate 0.3
+    OPENROUTER_URL=http://127.0.0.1:9000/api/v1/chat/completions uvicorn app.main:app
+"""
+import os
+import re
+import json
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+LATENCY = float(os.getenv("STUB_LATENCY", "0"))
+# Extra seconds per 1000 prompt tokens, as real models take longer on long prompts.
+LATENCY_PER_KTOKEN = float(os.getenv("STUB_LATENCY_PER_KTOKEN", "0"))
+
+app = FastAPI()
+stats = {"requests": 0, "errors": 0, "hangs": 0, "max_prompt_chars": 0}
+faults = {
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),  # share of requests answered with error_status
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", "503")),
+    "hang_rate": float(os.getenv("STUB_HANG_RATE", "0")),  # share of requests that never answer
+    "truncate_rate": float(os.getenv("STUB_TRUNCATE_RATE", "0")),  # share of streams closed after one word
+}
+
+
+def _reply(prompt):
+    if "Return ONLY a JSON object" in prompt:
+        return json.dumps({
+            "summary": "A short stub summary of the article.",
+            "vocabulary": [{"word": "stub", "definition": "a placeholder standing in for something real"}],
+        })
+    if "Return ONLY a JSON array of arrays" in prompt:
+        blocks = re.split(r"^Q\d+:", prompt, flags=re.M)[1:]
+        return json.dumps([
+            [f"Stub explanation {i + 1}{chr(65 + j)}." for j in range(len(re.findall(r"^  [A-Z]\) ", b, flags=re.M)))]
+            for i, b in enumerate(blocks)
+        ])
+    if "Return ONLY a JSON array" in prompt:
+        n = len(re.findall(r"^Q\d+:", prompt, flags=re.M))
+        return json.dumps([f"Stub explanation {i + 1}." for i in range(n)])
+    return "This is a stub answer."
+
+
+def _usage(prompt, content):
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": round((prompt_tokens * 0.1 + completion_tokens * 0.4) / 1e6, 8)}
+
+
+async def _stream(prompt, content, truncate=False):
+    yield ": OPENROUTER PROCESSING\n\n"
+    for word in content.split(" "):
+        chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if truncate:
+            return
+        await asyncio.sleep(0.01)
+    yield f"data: {json.dumps({'choices': [], 'usage': _usage(prompt, content)})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    stats["requests"] += 1
+    stats["max_prompt_chars"] = max(stats["max_prompt_chars"], len(prompt))
+    if random.random() < faults["hang_rate"]:
+        stats["hangs"] += 1
+        await asyncio.sleep(3600)
+    delay = LATENCY + LATENCY_PER_KTOKEN * len(prompt) / 4000
+    if delay:
+        await asyncio.sleep(delay)
+    if random.random() < faults["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"message": "injected fault"}}, status_code=faults["error_status"])
+    content = _reply(prompt)
+    if body.get("stream"):
+        truncate = random.random() < faults["truncate_rate"]
+        return StreamingResponse(_stream(prompt, content, truncate), media_type="text/event-stream")
+    return {
+        "id": f"stub-{stats['requests']}",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, content),
+    }
+
+
+@app.post("/stub/faults")
+async def set_faults(request: Request):
+    faults.update(await request.json())
+    return faults
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=LATENCY, help="seconds to wait before answering")
+    parser.add_argument("--latency-per-ktoken", type=float, default=LATENCY_PER_KTOKEN,
+                        help="extra seconds per 1000 prompt tokens")
+    parser.add_argument("--error-rate", type=float, default=faults["error_rate"])
+    parser.add_argument("--hang-rate", type=float, default=faults["hang_rate"])
+    args = parser.parse_args()
+    LATENCY, LATENCY_PER_KTOKEN = args.latency, args.latency_per_ktoken
+    faults.update(error_rate=args.error_rate, hang_rate=args.hang_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,161 @@
+"""Time the local text analysis, per article and over a bulk import.
+
+For each article length, the mean time text_analysis.analyze() takes and the
+level it assigns. Then imports the same generated articles with app.bulk into
+a temporary database twice, with the analysis and with it stubbed out, so the
+difference is what computing level, readability and key words at write time
+costs. Prints JSON.
+
+First it checks the levels assigned to SAMPLES, short texts written for a
+known level, and exits non-zero if any is off; --check stops there. The word
+lists run out around B2, so texts above it may read one level high.
+
+    python bench/text_analysis.py --words 100 1000 10000 --articles 20000
+    python bench/text_analysis.py --check
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+fd, DB_PATH = tempfile.mkstemp(suffix=".db")
+os.close(fd)
+os.environ.update({"DATABASE_URL": f"sqlite:///{DB_PATH}", "SINGLEFLIGHT_SHARED": "0", "JOB_WORKERS": "0"})
+
+from app import bulk, text_analysis  # noqa: E402
+
+# (text, levels accepted for it)
+SAMPLES = [
+    ("The cat sat on the mat. It was happy.", (None,)),  # too short to judge
+    ("My name is Anna. I have a dog and a cat. My dog is big and my cat is small.", (None,)),
+    ("""My name is Anna. I am ten years old. I live in a small house with my mother, my father and my brother Tom.
+I have a dog and a cat. My dog is big and brown. My cat is small and white. I like my pets very much.
+I go to school every day. My teacher is nice. I like English and music. After school I play with my friends in the park.
+In the evening I eat dinner with my family. I like pizza and apples. I go to bed at nine o'clock.""", ("A1",)),
+    ("""Last summer I went on holiday to the sea with my family. We stayed in a small hotel near the beach for two weeks.
+Every morning we had breakfast on the balcony and then we went swimming. The water was warm and very clear.
+One day my father rented a boat and we visited an island. We saw some dolphins and took a lot of photos.
+In the evenings we walked along the coast and ate ice cream. I bought some postcards and sent them to my friends.
+It was the best holiday of my life and I want to go back next year.""", ("A2",)),
+    ("""Many people believe that social media has changed the way we communicate with each other. In some ways this is true,
+because we can stay in touch with friends who live in other countries and share news instantly. However, some experts
+argue that spending too much time online can make people feel lonely and anxious. They suggest that we should limit
+the time we spend on our phones and try to meet friends face to face more often. In my opinion, social media is useful
+if we use it sensibly, but it should never replace real conversations.""", ("B1",)),
+    ("""The city council has approved a controversial plan to close the main shopping street to private cars from next spring.
+Supporters say the decision will reduce pollution and make the centre more attractive to pedestrians and cyclists, while
+local business owners fear that customers will simply drive to out-of-town retail parks instead. The council insists that
+public transport will be improved before the ban comes into force, with more frequent buses and a new park-and-ride service.
+Critics, however, point out that similar promises were made several years ago and were never fully delivered.""", ("B2", "C1")),
+    ("""The proliferation of algorithmically curated news feeds has prompted considerable scholarly debate about the extent
+to which individuals are insulated from dissenting perspectives. Proponents of the so-called filter bubble hypothesis
+contend that personalisation inexorably narrows exposure, thereby exacerbating polarisation. Empirical investigations,
+however, have yielded equivocal findings: several large-scale studies suggest that users' self-selection exerts a more
+pronounced influence on ideological homogeneity than any ranking mechanism. Consequently, attributing societal
+fragmentation predominantly to recommender systems may oversimplify a phenomenon with deeply entrenched sociological roots.""", ("C1", "C2")),
+]
+
+
+def _check_samples():
+    """Levels assigned to SAMPLES, and whether each is one of the accepted ones."""
+    out = []
+    for text, accepted in SAMPLES:
+        level = text_analysis.analyze(text).level
+        out.append({"text": text[:40], "level": level, "expected": accepted, "ok": level in accepted})
+    return out
+
+
+def _article(words, rng, vocabulary):
+    sentences, left = [], words
+    while left > 0:
+        n = min(left, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choice(vocabulary) for _ in range(n)).capitalize() + ".")
+        left -= n
+    return "<p>" + " ".join(sentences) + "</p>"
+
+
+def _per_article_ms(body, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        text_analysis.analyze(body)
+    return (time.perf_counter() - start) / n * 1000
+
+
+async def _import(lines):
+    from app.database import AsyncSessionLocal, get_async_engine
+
+    async def source():
+        for line in lines:
+            yield line
+
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await bulk.import_lines(db, source())
+    await get_async_engine().dispose()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--articles", type=int, default=20000, help="articles per bulk import")
+    parser.add_argument("--import-words", type=int, default=400, help="words per imported article")
+    parser.add_argument("--check", action="store_true", help="only check the levels of SAMPLES")
+    args = parser.parse_args()
+
+    samples = _check_samples()
+    if args.check:
+        os.unlink(DB_PATH)
+        print(json.dumps(samples, indent=2))
+        _exit_if_wrong(samples)
+        return
+
+    from app.database import init_db, engine
+
+    init_db()
+    rng = random.Random(1)
+    # Mostly common words with some rarer ones, like a graded reader.
+    ranked = list(text_analysis.RANKS)
+    vocabulary = ranked[:1000] * 4 + ranked[1000:]
+    report = {"samples": samples, "per_article": {}}
+    for words in args.words:
+        body = _article(words, rng, vocabulary)
+        stats = text_analysis.analyze(body)
+        report["per_article"][words] = {"ms": round(_per_article_ms(body, max(20, 100000 // words)), 3),
+                                        "level": stats.level, "reading_ease": stats.reading_ease,
+                                        "key_words": stats.key_words}
+
+    lines = [json.dumps({"type": "article", "title": f"Article {i}", "author": "bench",
+                         "body": _article(args.import_words, rng, vocabulary)}) for i in range(args.articles)]
+    analyzed = asyncio.run(_import(lines))
+    columns = text_analysis.article_columns
+    text_analysis.article_columns = lambda body: {}
+    try:
+        baseline = asyncio.run(_import(lines))
+    finally:
+        text_analysis.article_columns = columns
+    report["bulk_import"] = {"articles": args.articles, "words_each": args.import_words,
+                             "seconds_without_analysis": round(baseline, 2),
+                             "seconds_with_analysis": round(analyzed, 2),
+                             "ms_per_article_added": round((analyzed - baseline) / args.articles * 1000, 3)}
+    engine.dispose()
+    os.unlink(DB_PATH)
+    print(json.dumps(report, indent=2))
+    _exit_if_wrong(samples)
+
+
+def _exit_if_wrong(samples):
+    wrong = [s for s in samples if not s["ok"]]
+    if wrong:
+        sys.exit(f"{len(wrong)} sample text(s) got the wrong level")
+
+
+if __name__ == "__main__":
+    main()
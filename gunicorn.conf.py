@@ -0,0 +1,36 @@
+# Production server profile: gunicorn managing uvicorn worker processes.
+#
+#   gunicorn app.main:app -c gunicorn.conf.py
+#
+# WEB_CONCURRENCY overrides the worker count (defaults to one per core, since
+# each uvicorn worker is an event loop that keeps its core busy on its own).
+# /metrics is per process and not aggregated, so set WEB_CONCURRENCY=1 where
+# Prometheus scrapes it.
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap slow memory growth.
+max_requests = 2000
+max_requests_jitter = 200
+
+# forwarded_allow_ips stays at its default: "*" would make uvicorn trust the
+# leftmost, client-supplied X-Forwarded-For entry. The app reads the proxy's
+# entry itself (TRUSTED_PROXY_HOPS in app/main.py).
+
+# Import the app (and run init_db) once in the master, not once per worker
+# racing on the same schema.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened by the master while preloading must not be shared
+    # with the children.
+    from app.database import engine
+    engine.dispose(close=False)